@@ -0,0 +1,182 @@
+"""
+事業報告書PDFの一括作成 (コマンドライン版)
+
+JSON / CSV に書き出した報告データから、複数部署・複数月分のPDFを
+ワーカープロセスで並列に作成し、出力先フォルダに順次保存する。
+
+使い方:
+    python batch_generate.py reports.json -o out/ -j 4
+    python batch_generate.py reports.json --booklet 運営委員会配布用.pdf   # 目次付きの1冊にまとめる
+
+JSON は報告データ (report_data) のリスト:
+    [{"report_date": "2025-06-01", "department": "広報部",
+      "business_reports": [{"date": "6/1", "content": "..."}],
+      "issues": "...",
+      "next_activities": [{"date": "7/1", "content": "..."}]}, ...]
+
+CSV は1行に1項目を書く形式 (報告書作成日と担当部署ごとにまとめる):
+    report_date,department,section,date,content
+    section は business_reports / issues / next_activities のいずれか
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+SECTIONS = ("business_reports", "issues", "next_activities")
+CSV_COLUMNS = ("report_date", "department", "section", "date", "content")
+
+
+def load_records_json(path):
+    """JSONファイルから報告データのリストを読み込む"""
+    from report_pdf import report_data_from_json
+
+    with open(path, encoding="utf-8") as f:
+        records = json.load(f)
+    if isinstance(records, dict):
+        records = [records]
+    return [report_data_from_json(r) for r in records]
+
+
+def load_records_csv(path):
+    """CSVファイル (1行1項目) から報告データのリストを読み込む"""
+    records = {}
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        missing = [name for name in CSV_COLUMNS if name not in (reader.fieldnames or ())]
+        if missing:
+            raise ValueError(f"{path}: 列がありません: {', '.join(missing)}")
+        for row in reader:
+            # 末尾の項目が省略された行では値が None になるため、空として扱う
+            row = {name: row[name] or '' for name in CSV_COLUMNS}
+            section = row['section']
+            if section not in SECTIONS:
+                raise ValueError(f"不明な section です: {section}")
+            key = (row['report_date'], row['department'])
+            record = records.setdefault(key, {
+                'report_date': date.fromisoformat(row['report_date']),
+                'department': row['department'],
+                'business_reports': [],
+                'issues': '',
+                'next_activities': [],
+            })
+            if section == 'issues':
+                record['issues'] = row['content']
+            else:
+                record[section].append({'date': row['date'], 'content': row['content']})
+    return list(records.values())
+
+
+def load_records(path):
+    if path.lower().endswith(".csv"):
+        return load_records_csv(path)
+    return load_records_json(path)
+
+
+def _init_worker():
+    # フォントの読み込みとレイアウトのコンパイルは、ワーカープロセスごとに1回だけ行う
+    from report_pdf import load_shared_font, get_layout
+    load_shared_font()
+    get_layout()
+
+
+def _render_to_file(record, out_dir):
+    """1件分のPDFを作成して保存し、(ファイルパス, バイト数) を返す"""
+    from report_pdf import create_report_pdf, make_report_filename
+    pdf_bytes = create_report_pdf(record).getvalue()
+    path = os.path.join(out_dir, make_report_filename(record['report_date'], record['department']))
+    with open(path, "wb") as f:
+        f.write(pdf_bytes)
+    return path, len(pdf_bytes)
+
+
+def write_booklet(records, path):
+    """全報告データを1冊のPDFにまとめて保存する"""
+    from report_pdf import create_booklet_pdf
+
+    start = time.perf_counter()
+    metrics = {}
+    pdf_bytes = create_booklet_pdf(records, metrics).getvalue()
+    with open(path, "wb") as f:
+        f.write(pdf_bytes)
+    elapsed = time.perf_counter() - start
+    print(path)
+    print(
+        f"{len(records)}件を1冊に作成 ({metrics['pages']}ページ) / {elapsed:.2f}秒 / "
+        f"{len(records) / elapsed if elapsed else 0:.1f}件/秒 / {len(pdf_bytes) / 1024 / 1024:.2f}MB",
+        file=sys.stderr,
+    )
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="事業報告書PDFを一括作成します")
+    parser.add_argument("inputs", nargs="+", help="報告データのJSON/CSVファイル")
+    parser.add_argument("-o", "--out-dir", default=".", help="PDFの出力先フォルダ")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="ワーカープロセス数")
+    parser.add_argument("--booklet", metavar="PDF", help="部署ごとのPDFではなく、目次付きの1冊のPDFにまとめて保存する")
+    args = parser.parse_args(argv)
+
+    try:
+        records = [record for path in args.inputs for record in load_records(path)]
+    except (OSError, ValueError) as e:
+        print(f"報告データを読み込めません: {e}", file=sys.stderr)
+        return 1
+
+    # 画面の「入力完了」と同じ規則で確認し、誤りのある報告データは作成しない
+    from report_pdf import validate_report_data
+    invalid = 0
+    valid_records = []
+    for record in records:
+        error = validate_report_data(record)
+        if error:
+            invalid += 1
+            print(f"入力エラー: {record['department']} {record['report_date']}: {error}", file=sys.stderr)
+        else:
+            valid_records.append(record)
+    records = valid_records
+    if invalid and not records:
+        return 1
+
+    if args.booklet:
+        status = write_booklet(records, args.booklet)
+        return 1 if invalid else status
+
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    names = [(r['report_date'].year, r['report_date'].month, r['department']) for r in records]
+    if len(set(names)) != len(names):
+        print("警告: 同じ年月・部署の報告が複数あります。後から作成されたPDFで上書きされます。", file=sys.stderr)
+
+    start = time.perf_counter()
+    total_bytes = 0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as executor:
+        futures = {executor.submit(_render_to_file, record, args.out_dir): record for record in records}
+        for future in as_completed(futures):
+            record = futures[future]
+            try:
+                path, size = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"失敗: {record['department']} {record['report_date']}: {e}", file=sys.stderr)
+                continue
+            total_bytes += size
+            print(path)
+    elapsed = time.perf_counter() - start
+
+    done = len(records) - failed
+    print(
+        f"{done}件作成 ({failed}件失敗、{invalid}件入力エラー) / {elapsed:.2f}秒 / "
+        f"{done / elapsed if elapsed else 0:.1f}件/秒 / {total_bytes / 1024 / 1024:.2f}MB",
+        file=sys.stderr,
+    )
+    return 1 if failed or invalid else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
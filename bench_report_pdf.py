@@ -0,0 +1,239 @@
+"""
+事業報告書PDF作成のベンチマーク
+
+行数・文章の長さ・日本語と英数字の割合を変えた合成データで、
+フォント読み込み / 表の行レイアウト / 反省と課題の枠 / pdf.output() / base64エンコード
+の各処理時間と、ピークメモリ・出力サイズを計測してJSONに保存する。
+
+使い方:
+    python bench_report_pdf.py -o bench.json
+    python bench_report_pdf.py -o new.json --compare bench.json   # 前回の結果と比較
+"""
+import argparse
+import base64
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime
+
+import report_pdf
+from report_pdf import DEPARTMENTS
+
+ROW_COUNTS = (1, 10, 100, 1000)
+TEXT_LENGTHS = (20, 200, 1000)
+MIXES = ("cjk", "ascii", "mixed")
+
+QUICK_ROW_COUNTS = (1, 10, 100)
+QUICK_TEXT_LENGTHS = (20, 200)
+
+CJK_CHARS = "事業内容報告書運営委員会提出活動反省課題次年度以降改善材料詳細予定学年部広報校外安全指導教養環境厚生選考育成本会議準備参加保護者児童先生地域清掃見守り募集配布作成確認、。"
+ASCII_WORDS = ("PTA", "meeting", "report", "2025", "school", "event", "plan", "check", "OK", "No.")
+
+
+def make_text(rng, length, mix):
+    """指定した長さ・文字種の合成テキストを作る"""
+    parts = []
+    size = 0
+    while size < length:
+        use_cjk = mix == "cjk" or (mix == "mixed" and rng.random() < 0.5)
+        if use_cjk:
+            chunk = "".join(rng.choice(CJK_CHARS) for _ in range(rng.randint(2, 8)))
+        else:
+            chunk = rng.choice(ASCII_WORDS) + " "
+        parts.append(chunk)
+        size += len(chunk)
+    return "".join(parts)[:length]
+
+
+def make_report_data(rows, text_len, mix, department, seed=0):
+    """ベンチマーク用の報告データ (report_data) を作る"""
+    rng = random.Random(seed)
+    return {
+        'report_date': date(2025, 6, 1),
+        'department': department,
+        'business_reports': [
+            {'date': f"6/{i % 30 + 1}", 'content': make_text(rng, text_len, mix)} for i in range(rows)
+        ],
+        'issues': make_text(rng, text_len * 3, mix),
+        'next_activities': [
+            {'date': f"7/{i % 30 + 1}", 'content': make_text(rng, text_len, mix)} for i in range(rows)
+        ],
+    }
+
+
+def clear_caches():
+    """前回の計測結果がメモ化で使い回されないようにする"""
+    report_pdf.wrap_text_lines.cache_clear()
+    report_pdf._wrap_paragraph.cache_clear()
+    report_pdf.pdf_cache.clear()
+
+
+def bench_font_load():
+    """フォント読み込みとレイアウトのコンパイル (コールドスタート) の時間を計測する"""
+    report_pdf.load_shared_font.cache_clear()
+    report_pdf._measure_pdf.cache_clear()
+    report_pdf._glyph_widths.cache_clear()
+    report_pdf.get_layout.cache_clear()
+    start = time.perf_counter()
+    report_pdf.load_shared_font()
+    report_pdf.get_layout()
+    return time.perf_counter() - start
+
+
+def bench_phases(data):
+    """各処理を1回ずつ実行し、処理ごとの時間 (秒) を返す"""
+    timings = {'row_layout_s': 0.0}
+    clear_caches()
+    layout = report_pdf.get_layout()
+
+    pdf = report_pdf.new_pdf()
+    pdf.set_auto_page_break(False)
+    pdf.add_page()
+    pdf.set_font(report_pdf.FONT_FAMILY, size=layout.font_size)
+    y = layout.header_bottom
+    for element in layout.body:
+        start = time.perf_counter()
+        y = element.draw(pdf, data, y + element.gap)
+        # 表 (事業内容報告・活動予定) は行レイアウト、枠 (反省と課題) は別に集計する
+        name = 'issues_box_s' if isinstance(element, report_pdf.BoxElement) else 'row_layout_s'
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+    start = time.perf_counter()
+    pdf_bytes = bytes(pdf.output())
+    timings['output_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    base64.b64encode(pdf_bytes)
+    timings['base64_s'] = time.perf_counter() - start
+    return timings
+
+
+def bench_total(data, trace_memory=False):
+    """create_report_pdf 全体の時間・ピークメモリ・出力・計測値 (ページ数など) を返す"""
+    clear_caches()
+    metrics = {}
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    pdf_bytes = report_pdf.create_report_pdf(data, metrics).getvalue()
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak, pdf_bytes, metrics
+
+
+def run_case(rows, text_len, mix, department, repeat):
+    data = make_report_data(rows, text_len, mix, department)
+    best = {}
+    for _ in range(repeat):
+        for name, value in bench_phases(data).items():
+            best[name] = min(best.get(name, value), value)
+    total_s = min(bench_total(data)[0] for _ in range(repeat))
+    # ピークメモリは tracemalloc の負荷で時間が伸びるため、時間とは別に1回だけ測る
+    _, peak, pdf_bytes, metrics = bench_total(data, trace_memory=True)
+    best['total_s'] = total_s
+    return {
+        'rows': rows,
+        'text_len': text_len,
+        'mix': mix,
+        'department': department,
+        'timings': best,
+        'peak_memory_bytes': peak,
+        'output_bytes': len(pdf_bytes),
+        'pages': metrics['pages'],
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """前回の結果と比べて、各ケースの処理時間と出力サイズの比を表示する"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    base_cases = {(c['rows'], c['text_len'], c['mix']): c for c in baseline['cases']}
+    regressed = False
+    print(f"比較対象: {baseline['meta'].get('git_revision')} ({baseline_path})")
+    for case in results['cases']:
+        base = base_cases.get((case['rows'], case['text_len'], case['mix']))
+        if base is None:
+            continue
+        time_ratio = case['timings']['total_s'] / base['timings']['total_s']
+        size_ratio = case['output_bytes'] / base['output_bytes']
+        mark = ""
+        if time_ratio > threshold:
+            mark = "  << 遅くなっています"
+            regressed = True
+        print(
+            f"rows={case['rows']:>4} len={case['text_len']:>4} {case['mix']:<5} "
+            f"時間 x{time_ratio:.2f}  サイズ x{size_ratio:.2f}{mark}"
+        )
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="事業報告書PDF作成のベンチマーク")
+    parser.add_argument("-o", "--out", default="bench_results.json", help="結果を保存するJSONファイル")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="各ケースの繰り返し回数 (最小値を採用)")
+    parser.add_argument("--quick", action="store_true", help="行数・文章量を減らして短時間で計測する")
+    parser.add_argument("--compare", help="比較する前回の結果JSON")
+    parser.add_argument("--threshold", type=float, default=1.2, help="この倍率より遅くなったら終了コード1を返す")
+    args = parser.parse_args(argv)
+
+    row_counts = QUICK_ROW_COUNTS if args.quick else ROW_COUNTS
+    text_lengths = QUICK_TEXT_LENGTHS if args.quick else TEXT_LENGTHS
+
+    results = {
+        'meta': {
+            'git_revision': git_revision(),
+            'timestamp': datetime.now().isoformat(timespec="seconds"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'font_load_s': bench_font_load(),
+        'cases': [],
+    }
+    print(f"フォント読み込み: {results['font_load_s'] * 1000:.1f}ms")
+
+    n = 0
+    for rows in row_counts:
+        for text_len in text_lengths:
+            for mix in MIXES:
+                # 13部署分の合成データを順番に使う
+                department = DEPARTMENTS[n % len(DEPARTMENTS)]
+                n += 1
+                case = run_case(rows, text_len, mix, department, args.repeat)
+                results['cases'].append(case)
+                t = case['timings']
+                print(
+                    f"rows={rows:>4} len={text_len:>4} {mix:<5} "
+                    f"total={t['total_s'] * 1000:8.1f}ms layout={t['row_layout_s'] * 1000:8.1f}ms "
+                    f"issues={t['issues_box_s'] * 1000:6.1f}ms output={t['output_s'] * 1000:7.1f}ms "
+                    f"base64={t['base64_s'] * 1000:5.2f}ms pages={case['pages']:>3} "
+                    f"size={case['output_bytes'] / 1024:7.1f}KB peak={case['peak_memory_bytes'] / 1024 / 1024:6.1f}MB"
+                )
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {args.out}")
+
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,312 +1,89 @@
 import streamlit as st
 from datetime import date
-import io
 import base64
+import sqlite3
+import time
 
-# fpdf2 をインポート
-from fpdf import FPDF
+# 再実行 (rerun) 全体の所要時間の計測開始
+rerun_start = time.perf_counter()
 
-# 日本語フォントのパス (プロジェクトのルートにIPAexGothic.ttfがあることを想定)
-# Renderにデプロイする際、このファイルもGitリポジションに含める必要があります。
-FONT_PATH = "IPAexGothic.ttf"
+# PDFの作成処理は Streamlit に依存しない report_pdf にまとめている
+from report_pdf import DEPARTMENTS, load_shared_font, convert_to_wareki, make_report_filename, render_page_thumbnails, phase_timer, emit_metrics, get_generation_pool, GenerationQueueFull, GenerationWorkerLost, validate_report_data, pdf_cache
+from report_archive import ReportArchive
 
-# FPDFのサブクラスを作成し、コンストラクタでフォントを登録
-class MyFPDF(FPDF):
-    def __init__(self):
-        super().__init__()
-        try:
-            # フォントファイルの登録
-            # fname にはフォントファイルのパスを指定
-            self.add_font("IPAexGothic", fname=FONT_PATH)
-            # デフォルトでこのフォントを使用するように設定
-            self.set_font("IPAexGothic", size=12) # デフォルトサイズを12に変更
-        except Exception as e:
-            # Streamlit上でエラーメッセージを表示し、スクリプトの実行を停止
-            st.error(f"フォントの読み込みに失敗しました: {e}. '{FONT_PATH}' が存在するか確認してください。")
-            st.stop() # Streamlitアプリケーションの実行を停止
-
-def convert_to_wareki(dt):
-    """日付を和暦文字列に変換する"""
-    if dt.year >= 2019:
-        era_name = "令和"
-        era_year = dt.year - 2018
-    elif dt.year >= 1989: # 平成の範囲
-        era_name = "平成"
-        era_year = dt.year - 1988
-    else: # その他の年 (昭和以前はここでは扱わない)
-        era_name = "西暦"
-        era_year = dt.year
-    return f"{era_name}{era_year}年{dt.month}月{dt.day}日"
-
-def create_report_pdf(data):
-    """
-    入力データに基づいて事業報告書PDFを作成する (fpdf2バージョン)
-    仕様書PDFのレイアウトを再現
-    """
-    try:
-        pdf = MyFPDF()
-    except RuntimeError as e:
-        st.error(str(e))
-        return None
-
-    pdf.add_page()
-    
-    # 全体の左右余白
-    page_width = pdf.w
-    # ご要望の左右余白30mmを反映
-    left_margin_mm = 30
-    right_margin_mm = 30
-    
-    # メインコンテンツエリアの開始X座標と幅
-    content_area_x = left_margin_mm
-    content_area_width = page_width - left_margin_mm - right_margin_mm
-    
-    # --- ヘッダー部分 ---
-    # ***運営委員会にて提出をお願いします***
-    pdf.set_font("IPAexGothic", size=10)
-    pdf.set_xy(0, 15) # Y座標を調整
-    pdf.cell(w=page_width, h=5, txt="***運営委員会にて提出をお願いします***", ln=1, align='C') # 中央揃え
-
-    # タイトル: 事業内容報告書
-    pdf.set_font("IPAexGothic", size=20)
-    pdf.set_xy(0, pdf.get_y() + 5) # Y座標を調整
-    pdf.cell(w=page_width, h=10, txt="事業内容報告書", align='C', ln=1)
-
-    # 右上の日付 (「令和 年 月 日」形式)
-    pdf.set_font("IPAexGothic", size=12)
-    # 日付のY座標はタイトルから少し下に調整
-    date_y = pdf.get_y() + 5
-    pdf.set_xy(page_width - right_margin_mm - 60, date_y) # 右寄せで日付のセル開始位置を調整
-    pdf.cell(60, 5, convert_to_wareki(data['report_date']), align='R', ln=1)
-
-    # 「学年」「部」の枠線とテキスト (下線のみに戻す)
-    # 添付ファイルの位置に合わせて調整
-    # Y座標は日付の少し下から開始
-    box_y_start = date_y + 10 
-    line_x_start = left_margin_mm + 10 # 添付ファイルに合わせた開始X座標
-    line_x_end = left_margin_mm + 70 # 添付ファイルに合わせた終了X座標
-    line_height = 8
-
-    pdf.set_font("IPAexGothic", size=12)
-    
-    # 学年
-    pdf.set_xy(line_x_start, box_y_start)
-    pdf.cell(w=line_x_end - line_x_start, h=line_height, txt="　", border='B', align='L') # 下線のみ
-
-    # 部
-    pdf.set_xy(line_x_start, box_y_start + line_height + 2) # 学年から少し下に
-    pdf.cell(w=line_x_end - line_x_start, h=line_height, txt="　", border='B', align='L') # 下線のみ
-
-    # 担当部署のテキスト
-    # 部のライン上に担当部署名が来るように調整
-    pdf.set_xy(line_x_start + 10, box_y_start + line_height + 2) # 「部」のテキストの少し右
-    pdf.cell(w=line_x_end - line_x_start - 10, h=line_height, txt=data['department'], align='L')
-
-
-    # --- 事業内容報告 (メインコンテンツ) ---
-    # メインコンテンツの開始Y座標はヘッダー部分の終了位置から調整
-    y_current = box_y_start + line_height * 2 + 15 # ヘッダーの学年・部から少し空ける
-
-    # 1行目: 「日程」と「事業内容報告」ヘッダー
-    pdf.set_xy(content_area_x, y_current)
-    pdf.cell(w=content_area_width * 0.2, h=10, txt="日程", border=1, align='C') 
-    pdf.cell(w=content_area_width * 0.8, h=10, txt="事業内容報告", border=1, ln=1, align='C')
-    y_current = pdf.get_y() # ヘッダーの次のY座標
-
-    # 2行目以降: 入力データ
-    for i, item in enumerate(data['business_reports']):
-        # multi_cellでテキストが占める実際の高さを計算する
-        # 現在のX, Y座標と幅を保存
-        start_x_content = content_area_x + content_area_width * 0.2 + 1 # 事業内容報告のテキスト開始X
-        start_y_content = y_current + 2 # コメント開始行を調整 (少し高く)
-        text_w_content = content_area_width * 0.8 - 2 # 左右パディング考慮
-        
-        # ダミーでmulti_cellを実行し、テキストが占める高さを取得
-        # (ただし、実際に描画はしない)
-        pdf.set_xy(start_x_content, start_y_content)
-        temp_y_before = pdf.get_y()
-        pdf.multi_cell(w=text_w_content, h=5, txt=item['content'], align='L')
-        height_of_content_text = pdf.get_y() - temp_y_before
-        
-        # 枠の最終的な高さを決定 (テキストの高さ + 上下パディング)
-        # 最小高は10mmとし、テキストの高さに合わせて調整
-        calculated_height = max(10, height_of_content_text + (start_y_content - y_current) * 2 ) # 上下パディング考慮
-        
-        # PDFのY座標を元の位置に戻す
-        pdf.set_y(y_current) 
-
-        # 枠を描画
-        pdf.rect(content_area_x, y_current, content_area_width * 0.2, calculated_height) # 日程の枠
-        pdf.rect(content_area_x + content_area_width * 0.2, y_current, content_area_width * 0.8, calculated_height) # 事業内容報告の枠
-        
-        # テキスト位置調整
-        # 日程 (垂直方向中央揃え)
-        pdf.set_xy(content_area_x, y_current + (calculated_height - pdf.font_size / pdf.k) / 2)
-        pdf.cell(w=content_area_width * 0.2, h=pdf.font_size / pdf.k, txt=item['date'], align='C')
-
-        # 事業内容報告 (上揃え)
-        pdf.set_xy(start_x_content, start_y_content) # 調整した開始Y座標を使用
-        pdf.multi_cell(w=text_w_content, h=5, txt=item['content'], align='L')
-        
-        # 次の行の開始Y座標を更新
-        y_current += calculated_height # 枠の高さ分だけY座標を進める
-
-
-    # --- 活動の反省と課題 ---
-    y_current += 10 # 前のセクションからのマージン
-
-    # 3行目: 「活動の反省と課題」ヘッダー
-    pdf.set_y(y_current) # 現在のY座標から開始
-    
-    header_text_line1 = "活動の反省と課題"
-    header_text_line2 = "(次年度以降の改善材料になりますので詳細にお願いします)"
-    combined_header_text = header_text_line1 + "\n" + header_text_line2
-    
-    # --- 活動の反省と課題 --- (1つの枠に2行ヘッダーテキストを配置)
-    
-    # 1. 結合したテキストが占める高さを事前に計算する (dry_run=Trueで描画はしない)
-    temp_y_before_header_calc = pdf.get_y()
-    # テキストを左右パディング1mm/kで描画すると仮定
-    pdf.set_xy(content_area_x + 1, temp_y_before_header_calc)
-    # 1行の高さh=5(目安)を指定し、テキストの実際の高さを取得
-    pdf.multi_cell(w=content_area_width - 2, h=5, txt=combined_header_text, align='C', dry_run=True)
-    height_of_combined_header_text = pdf.get_y() - temp_y_before_header_calc
-    # Y座標をリセット
-    pdf.set_y(temp_y_before_header_calc) 
-    
-    # 2. ヘッダー枠全体の高さを決定
-    # 調整ポイント: 上下パディングを9mmから5mmに削減 (テキストを上に寄せ、枠の底も上げる)
-    header_box_padding = 5 # 上下2.5mm * 2 程度
-    # 最小高は、2行テキストが無理なく収まる高さに設定
-    header_box_height = max(16, height_of_combined_header_text + header_box_padding) # 最小高を20から16mmに調整 
-    
-    # 3. ヘッダー枠を描画
-    pdf.rect(content_area_x, y_current, content_area_width, header_box_height) 
-    
-    # 4. テキストを枠内に配置 (垂直方向の中央揃え + 補正)
-    # 調整ポイント: 計算結果から 1.5mm を差し引き、文字列全体を上に移動させる
-    text_y_start_for_header = y_current + (header_box_height - height_of_combined_header_text) / 2 - 4.5
-    
-    pdf.set_xy(content_area_x + 1, text_y_start_for_header)
-    # h=5(目安)でmulti_cellを描画
-    pdf.multi_cell(w=content_area_width - 2, h=5, txt=combined_header_text, align='C')
-    
-    y_current += header_box_height # このヘッダー枠の高さ分だけY座標を進める
-
-    # --- 入力データ (反省と課題のコメント欄) ---
-    
-    # 4行目: 入力データ
-    start_x_issues = content_area_x + 1
-    issue_box_padding = 9 # 上下4.5mm * 2
-    text_w_issues = content_area_width - 2 
-    
-    # 1. テキストが占める高さを事前に計算する (dry_run=Trueで描画はしない)
-    temp_y_before_issues_calc = pdf.get_y()
-    pdf.set_xy(start_x_issues, temp_y_before_issues_calc + 4.5) # 仮の開始位置 + 上パディング
-    pdf.multi_cell(w=text_w_issues, h=5, txt=data['issues'], align='L', dry_run=True)
-    height_of_issues_text = pdf.get_y() - (temp_y_before_issues_calc + 4.5)
-    # Y座標をリセット
-    pdf.set_y(temp_y_before_issues_calc) 
-    
-    # 2. 枠の最終的な高さを決定
-    min_issue_height_5_lines = 5 * (pdf.font_size * 1.2 / pdf.k) + issue_box_padding # 5行の目安
-    issue_box_height = max(min_issue_height_5_lines, height_of_issues_text + issue_box_padding) 
-    
-    # 3. 枠を描画
-    pdf.rect(content_area_x, y_current, content_area_width, issue_box_height) 
-    
-    # 4. テキストを枠内に配置
-    pdf.set_xy(start_x_issues, y_current + 4.5) # 枠の開始Y座標 + 上パディング
-    pdf.multi_cell(w=text_w_issues, h=5, txt=data['issues'], align='L')
-     
-    y_current += issue_box_height # 次のセクションの開始Y座標
-
-    # --- 次回運営委員会までの活動予定 ---
-    y_current += 10 # 前のセクションからのマージン
-
-    # 5行目: 「日程」と「次回運営委員会までの活動予定」ヘッダー
-    pdf.set_xy(content_area_x, y_current)
-    pdf.cell(w=content_area_width * 0.2, h=10, txt="日程", border=1, align='C')
-    pdf.cell(w=content_area_width * 0.8, h=10, txt="次回運営委員会までの活動予定", border=1, ln=1, align='C')
-    y_current = pdf.get_y() # ヘッダーの次のY座標
-
-    # 6行目以降: 入力データ
-    for i, item in enumerate(data['next_activities']):
-        # multi_cellでテキストが占める実際の高さを計算する
-        start_x_content = content_area_x + content_area_width * 0.2 + 1
-        start_y_content = y_current + 2 # コメント開始行を調整 (少し高く)
-        text_w_content = content_area_width * 0.8 - 2
-        
-        pdf.set_xy(start_x_content, start_y_content)
-        temp_y_before = pdf.get_y()
-        pdf.multi_cell(w=text_w_content, h=5, txt=item['content'], align='L')
-        height_of_content_text = pdf.get_y() - temp_y_before
-        
-        calculated_height = max(10, height_of_content_text + (start_y_content - y_current) * 2 )
-        
-        pdf.set_y(y_current) 
-
-        # 枠を描画
-        pdf.rect(content_area_x, y_current, content_area_width * 0.2, calculated_height)
-        pdf.rect(content_area_x + content_area_width * 0.2, y_current, content_area_width * 0.8, calculated_height)
-
-        # テキスト位置調整
-        # 日程 (垂直方向中央揃え)
-        pdf.set_xy(content_area_x, y_current + (calculated_height - pdf.font_size / pdf.k) / 2)
-        pdf.cell(w=content_area_width * 0.2, h=pdf.font_size / pdf.k, txt=item['date'], align='C')
-
-        # 活動予定 (上揃え)
-        pdf.set_xy(start_x_content, start_y_content) # 調整した開始Y座標を使用
-        pdf.multi_cell(w=text_w_content, h=5, txt=item['content'], align='L')
-
-        y_current += calculated_height # 枠の高さ分だけY座標を進める
-    
-    # PDFをバイトストリームとして出力
-    return io.BytesIO(pdf.output())
-
-
-# --- Streamlit UI の構築 (変更なし) ---
+# --- Streamlit UI の構築 ---
 st.set_page_config(layout="wide")
 st.title("事業報告書作成アプリ")
 
+# フォントは起動時に読み込み、失敗した場合は入力前に停止する
+try:
+    load_shared_font()
+except RuntimeError as e:
+    st.error(str(e))
+    st.stop()
+
+# URLに ?debug=1 を付けると、PDF作成の計測値を画面下部に表示する
+debug_mode = st.query_params.get("debug") == "1"
+# PDFを作成した回だけ、処理ごとの時間などを記録する
+generation_metrics = None
+
+# 提出済みの報告書とPDFの保存庫 (全セッションで共有する)
+@st.cache_resource
+def get_archive():
+    return ReportArchive()
+
+# --- 行入力欄 (事業内容報告・活動予定) ---
+
+def new_row():
+    """空の入力行を作成する (id は行を削除してもずれないウィジェットのキーに使う)"""
+    st.session_state.row_seq = st.session_state.get('row_seq', 0) + 1
+    return {'id': st.session_state.row_seq, 'date': '', 'content': ''}
+
+def add_row(list_key):
+    st.session_state[list_key].append(new_row())
+
+def delete_row(list_key, row_id):
+    st.session_state[list_key] = [row for row in st.session_state[list_key] if row['id'] != row_id]
+
+@st.fragment
+def row_editor(list_key, key_prefix, content_label, add_label, add_key):
+    """
+    日程と内容の行入力欄を表示する
+    fragment なので、入力や追加・削除ではこの欄だけが再実行される
+    追加・削除はコールバックで行うため、再実行は1回で済む
+    """
+    for i, row in enumerate(st.session_state[list_key]):
+        cols = st.columns([0.2, 0.7, 0.1])
+        with cols[0]:
+            row['date'] = st.text_input(f"日程 {i+1}", value=row['date'], key=f"{key_prefix}_date_{row['id']}")
+        with cols[1]:
+            row['content'] = st.text_area(f"{content_label} {i+1}", value=row['content'], key=f"{key_prefix}_content_{row['id']}", height=50)
+        with cols[2]:
+            if i > 0: # 最初の項目は削除できないようにする
+                st.button("削除", key=f"{key_prefix}_delete_{row['id']}", on_click=delete_row, args=(list_key, row['id']))
+
+    st.button(add_label, key=add_key, on_click=add_row, args=(list_key,))
+
 # --- 3. 入力画面の要件 ---
 
 st.header("入力項目")
 
 # 報告書作成日
-today = date.today()
-report_date = st.date_input("報告書作成日", value=today, key="report_date_input")
+# (過去の報告書から読み込めるよう、初期値は session_state に入れておく)
+if 'report_date_input' not in st.session_state:
+    st.session_state.report_date_input = date.today()
+report_date = st.date_input("報告書作成日", key="report_date_input")
 st.write(f"和暦表記: {convert_to_wareki(report_date)}")
 
 # 担当部署
-departments = [
-    "学年委員1年", "学年委員2年", "学年委員3年",
-    "学年委員4年", "学年委員5年", "学年委員6年",
-    "学年委員あゆみ", "広報部", "校外安全指導部",
-    "教養部", "環境厚生部", "選考委員会", "育成会本部"
-]
-selected_department = st.selectbox("担当部署", departments, key="department_select")
+selected_department = st.selectbox("担当部署", DEPARTMENTS, key="department_select")
 
 st.subheader("事業内容報告")
 # 初期表示は最低1セット。st.session_state を使用して状態を保持
 if 'business_reports' not in st.session_state:
-    st.session_state.business_reports = [{'date': '', 'content': ''}]
+    st.session_state.business_reports = [new_row()]
 
-for i, report in enumerate(st.session_state.business_reports):
-    cols = st.columns([0.2, 0.7, 0.1])
-    with cols[0]:
-        report['date'] = st.text_input(f"日程 {i+1}", value=report['date'], key=f"br_date_{i}")
-    with cols[1]:
-        report['content'] = st.text_area(f"事業内容報告 {i+1}", value=report['content'], key=f"br_content_{i}", height=50)
-    with cols[2]:
-        if i > 0: # 最初の項目は削除できないようにする
-            if st.button("削除", key=f"br_delete_{i}"):
-                st.session_state.business_reports.pop(i)
-                st.rerun() # 削除後にUIを再描画
-
-if st.button("事業内容報告を追加", key="add_business_report_button"):
-    st.session_state.business_reports.append({'date': '', 'content': ''})
-    st.rerun()
+row_editor('business_reports', 'br', "事業内容報告", "事業内容報告を追加", "add_business_report_button")
 
 
 st.subheader("活動の反省と課題")
@@ -319,23 +96,9 @@ issues = st.text_area(
 st.subheader("次回運営委員会までの活動予定")
 # 初期表示は最低1セット
 if 'next_activities' not in st.session_state:
-    st.session_state.next_activities = [{'date': '', 'content': ''}]
-
-for i, activity in enumerate(st.session_state.next_activities):
-    cols = st.columns([0.2, 0.7, 0.1])
-    with cols[0]:
-        activity['date'] = st.text_input(f"日程 {i+1}", value=activity['date'], key=f"na_date_{i}")
-    with cols[1]:
-        activity['content'] = st.text_area(f"活動予定 {i+1}", value=activity['content'], key=f"na_content_{i}", height=50)
-    with cols[2]:
-        if i > 0: # 最初の項目は削除できないようにする
-            if st.button("削除", key=f"na_delete_{i}"):
-                st.session_state.next_activities.pop(i)
-                st.rerun() # 削除後にUIを再描画
+    st.session_state.next_activities = [new_row()]
 
-if st.button("活動予定を追加", key="add_next_activity_button"):
-    st.session_state.next_activities.append({'date': '', 'content': ''})
-    st.rerun()
+row_editor('next_activities', 'na', "活動予定", "活動予定を追加", "add_next_activity_button")
 
 
 # --- 4. 機能要件 ---
@@ -343,79 +106,168 @@ if st.button("活動予定を追加", key="add_next_activity_button"):
 st.markdown("---")
 # 「入力完了」ボタン
 if st.button("**入力完了**", key="submit_button"):
-    # エラー処理: 必須項目チェック
-    # 各項目が空でないことを確認
-    if not selected_department:
-        st.warning("担当部署を選択してください。")
-    elif not all(item['date'].strip() and item['content'].strip() for item in st.session_state.business_reports if item['date'] or item['content']):
-        st.warning("事業内容報告の日程と内容をすべて入力するか、不要な行を削除してください。")
-    elif not issues.strip():
-        st.warning("活動の反省と課題を入力してください。")
-    elif not all(item['date'].strip() and item['content'].strip() for item in st.session_state.next_activities if item['date'] or item['content']):
-        st.warning("次回活動予定の日程と内容をすべて入力するか、不要な行を削除してください。")
+    # PDF生成データ準備
+    # (作成はバックグラウンドで行うため、入力中の行とは別のコピーを渡す)
+    report_data = {
+        'report_date': report_date,
+        'department': selected_department,
+        'business_reports': [dict(item) for item in st.session_state.business_reports],
+        'issues': issues,
+        'next_activities': [dict(item) for item in st.session_state.next_activities],
+    }
+
+    # エラー処理: 必須項目チェック (HTTP API と同じ規則)
+    error = validate_report_data(report_data)
+    if error:
+        st.warning(error)
     else:
-        # PDF生成データ準備
-        report_data = {
-            'report_date': report_date,
-            'department': selected_department,
-            'business_reports': st.session_state.business_reports,
-            'issues': issues,
-            'next_activities': st.session_state.next_activities,
-        }
-
-        # PDF生成
-        pdf_buffer = create_report_pdf(report_data)
-
-        st.success("PDFが生成されました！確認できたら保存ボタンを押してください！")
-        st.subheader("プレビュー")
-
-        
-        # PDFのバイナリデータを取得
-        pdf_data_bytes = pdf_buffer.getvalue()
-
-        # Base64エンコード
-        # base64エンコードされた文字列は必ずASCII文字なので、decode('ascii')で安全に変換
-        base64_pdf = base64.b64encode(pdf_data_bytes).decode('ascii')
-
-        # data: URIスキームとしてHTMLの<iframe>タグに埋め込む
-        pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="600px" type="application/pdf"></iframe>'
-
-        # StreamlitでHTMLとして表示
-        # unsafe_allow_html=True は必須
-        st.markdown(pdf_display, unsafe_allow_html=True)
+        # PDF生成はワーカープールに依頼し、結果は下の show_pdf_job で受け取る
+        # 同じ内容で何度押されても、作成済みのPDFを使い回す
+        try:
+            st.session_state.pdf_job = get_generation_pool().submit(report_data)
+            st.session_state.pdf_job_data = report_data
+            st.session_state.pdf_job_file_name = make_report_filename(report_date, selected_department)
+            st.session_state.pdf_job_reported = False
+        except GenerationQueueFull:
+            st.warning("ただいま混み合っています。少し待ってからもう一度「入力完了」を押してください。")
+        except GenerationWorkerLost:
+            st.warning("PDFを作成できませんでした。少し待ってからもう一度「入力完了」を押してください。")
+
+@st.fragment(run_every=0.5)
+def wait_for_pdf_job(job):
+    """作成中の状態を表示し、完了したら画面全体を再実行して結果を表示する"""
+    if job.done():
+        st.rerun()
+    st.info(f"PDFを作成しています… ({job.state()}、{job.elapsed():.0f}秒経過)")
+
+def show_pdf_job():
+    """依頼したPDFの作成状況、または作成結果 (プレビューと保存ボタン) を表示する"""
+    global generation_metrics
+
+    job = st.session_state.get('pdf_job')
+    if job is None:
+        return
+    if not job.done():
+        wait_for_pdf_job(job)
+        return
 
+    try:
+        pdf_data_bytes = job.result()
+    except GenerationWorkerLost:
+        st.warning("PDFの作成が中断されました。もう一度「入力完了」を押してください。")
+        return
+    except Exception as e:
+        st.error(f"PDFの作成に失敗しました: {e}")
+        return
+
+    # 計測値の出力と保存庫への保存は、結果を最初に表示した回だけ行う
+    if not st.session_state.pdf_job_reported:
+        st.session_state.pdf_job_reported = True
+        generation_metrics = job.metrics
+        try:
+            get_archive().save(st.session_state.pdf_job_data, pdf_data_bytes, st.session_state.pdf_job_file_name)
+        except sqlite3.Error as e:
+            st.warning(f"報告書を保存庫に登録できませんでした: {e}")
+    lap = phase_timer(generation_metrics)
 
-        st.markdown("---")
-        st.subheader("PDF保存")
-        st.write("内容を確認しましたか？PDFデータを保存しますか？")
+    st.success("PDFが生成されました！確認できたら保存ボタンを押してください！")
+    st.subheader("プレビュー")
 
-        # ファイル名生成
-        wareki_year_str = convert_to_wareki(report_date).split('年')[0] # 例: "令和7"
-        wareki_prefix = ""
-        wareki_num = ""
-        # 漢字部分と数字部分を分離
-        for char in wareki_year_str:
-            if '一' <= char <= '九' or '〇' <= char <= '九' or '０' <= char <= '９': # 漢数字や全角数字も考慮
-                wareki_num += str(char)
-            else:
-                wareki_prefix += char
 
-        # 数字を半角に変換 (全角数字対策)
-        wareki_num = wareki_num.replace('〇', '0').replace('一', '1').replace('二', '2').replace('三', '3').replace('四', '4').replace('五', '5').replace('六', '6').replace('七', '7').replace('八', '8').replace('九', '9')
-        wareki_num = "".join(filter(str.isdigit, wareki_num)) # 半角数字以外を除去
+    # プレビューは各ページを軽量な画像にして表示する
+    # (PDFのバイト列はダウンロードと共通の1つだけを使う)
+    try:
+        thumbnails = render_page_thumbnails(pdf_data_bytes)
+    except ImportError:
+        thumbnails = None
 
-        final_wareki_year_tag = f"R{wareki_num}" if wareki_num else f"{report_date.year}" # 数字がなければ西暦を使用
+    if thumbnails:
+        st.image(list(thumbnails), caption=[f"{n}ページ" for n in range(1, len(thumbnails) + 1)])
+        lap('preview')
+    else:
+        # pypdfium2 が無い環境では従来通りPDFを埋め込んで表示する
+        # base64エンコードされた文字列は必ずASCII文字なので、decode('ascii')で安全に変換
+        base64_pdf = base64.b64encode(pdf_data_bytes).decode('ascii')
+        lap('base64')
+        pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="600px" type="application/pdf"></iframe>'
+        # unsafe_allow_html=True は必須
+        st.markdown(pdf_display, unsafe_allow_html=True)
 
-        file_month = report_date.month
-        file_name = f"{final_wareki_year_tag}.{file_month:02d}事業報告書_{selected_department}.pdf"
+    st.markdown("---")
+    st.subheader("PDF保存")
+    st.write("内容を確認しましたか？PDFデータを保存しますか？")
+
+    st.download_button(
+        label="**PDFデータを保存**",
+        data=pdf_data_bytes,
+        file_name=st.session_state.pdf_job_file_name,
+        mime="application/pdf",
+        key="download_pdf_button"
+    )
+
+show_pdf_job()
+
+# --- 過去の報告書 ---
+
+def load_into_form(report_id):
+    """保存済みの報告書の内容を入力欄に読み込む"""
+    data = get_archive().get_report_data(report_id)
+    if data is None:
+        return
+    st.session_state.report_date_input = data['report_date']
+    if data['department'] in DEPARTMENTS:
+        st.session_state.department_select = data['department']
+    st.session_state.issues_text_area = data['issues']
+    for list_key in ('business_reports', 'next_activities'):
+        st.session_state[list_key] = [dict(new_row(), date=item['date'], content=item['content']) for item in data[list_key]] or [new_row()]
+    st.session_state.pop('pdf_job', None)
+    st.session_state.archive_loaded = True
+
+@st.fragment
+def archive_browser():
+    """部署・年月・語句で過去の報告書を探し、作り直さずに再ダウンロードできるようにする"""
+    cols = st.columns(4)
+    with cols[0]:
+        department = st.selectbox("担当部署", ["すべて"] + DEPARTMENTS, key="archive_department")
+    with cols[1]:
+        wareki_year = st.text_input("年 (例: 令和7)", key="archive_year")
+    with cols[2]:
+        month = st.selectbox("月", [None] + list(range(1, 13)), format_func=lambda m: "すべて" if m is None else f"{m}月", key="archive_month")
+    with cols[3]:
+        text = st.text_input("語句", key="archive_text")
+
+    results = get_archive().search(
+        department=None if department == "すべて" else department,
+        wareki_year=wareki_year.strip().replace("元", "1"),
+        month=month,
+        text=text.strip(),
+        limit=20,
+    )
+    if not results:
+        st.write("該当する報告書はありません。")
+    for row in results:
+        cols = st.columns([0.6, 0.2, 0.2])
+        with cols[0]:
+            st.write(f"{row['file_name']} (提出: {row['submitted_at'].replace('T', ' ')})")
+        with cols[1]:
+            st.download_button(
+                "PDFを保存",
+                # PDF本体は押されたときに保存庫から読み込む (一覧の表示では読み込まない)
+                data=lambda sha256=row['pdf_sha256']: get_archive().get_pdf(sha256),
+                file_name=row['file_name'],
+                mime="application/pdf",
+                key=f"archive_download_{row['id']}",
+            )
+        with cols[2]:
+            st.button("入力欄に読み込む", key=f"archive_load_{row['id']}", on_click=load_into_form, args=(row['id'],))
+
+    # 読み込んだ内容を入力欄に反映するため、画面全体を再実行する
+    if st.session_state.pop('archive_loaded', False):
+        st.rerun()
 
-        st.download_button(
-            label="**PDFデータを保存**",
-            data=pdf_buffer.getvalue(),
-            file_name=file_name,
-            mime="application/pdf",
-            key="download_pdf_button"
-        )
+st.markdown("---")
+with st.expander("過去の報告書を探す"):
+    archive_browser()
 
 # 任意で「入力内容をクリア」ボタン
 if st.button("入力内容をクリア", key="clear_button"):
@@ -423,3 +275,12 @@ if st.button("入力内容をクリア", key="clear_button"):
     for key in list(st.session_state.keys()): # list() でコピーを作成してから削除
         del st.session_state[key]
     st.rerun() # UIを再描画して初期状態に戻す
+
+# PDFを作成した回は、再実行全体の時間も含めて計測値を出力する
+if generation_metrics is not None:
+    generation_metrics.setdefault('phases', {})['rerun'] = time.perf_counter() - rerun_start
+    emit_metrics(generation_metrics)
+    if debug_mode:
+        with st.expander("デバッグ: PDF作成の計測値"):
+            st.json(generation_metrics)
+            st.json({'pool': get_generation_pool().stats(), 'cache': pdf_cache.stats()})
@@ -0,0 +1,210 @@
+"""
+事業報告書アプリの同時利用の負荷試験
+
+Streamlit の AppTest で画面 (code01.py) を画面なしで動かし、N人分のセッションが
+それぞれ行を追加・入力して「入力完了」を押す操作を再現する。
+再実行 (rerun) とPDF作成 (「入力完了」から結果が表示されるまで) の時間の p50/p95 と、
+セッション1つあたりの常駐メモリ (RSS) を表示し、JSONにも保存する。
+
+使い方:
+    python load_test.py -n 20 --rows 10 -o load.json
+
+AppTest は1回の実行ごとにプロセス全体で1つの実行環境を作るため、
+複数のセッションを別スレッドで同時に実行することはできない。
+そのため各セッションの操作を1ステップずつ順番に進め、全員のセッションを同時に開いた状態で
+PDF作成の依頼がワーカープールで重なるようにしている。
+セッションあたりのメモリには AppTest 自身の保持する画面要素も含まれる (上限の目安)。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "code01.py")
+
+
+def rss_bytes(pid="self"):
+    """プロセスの常駐メモリ (RSS) のバイト数 (Linux 以外では最大RSSで代用する)"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        if pid != "self":
+            return 0
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == "darwin" else usage * 1024
+
+
+def worker_rss_bytes():
+    """PDF作成ワーカー (子プロセス) のRSSの合計"""
+    return sum(rss_bytes(p.pid) for p in multiprocessing.active_children())
+
+
+def percentile(values, p):
+    """値のリストの p パーセンタイル (最近傍順位法)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50_s': percentile(values, 50),
+        'p95_s': percentile(values, 95),
+        'max_s': max(values) if values else None,
+    }
+
+
+def simulated_session(n, rows, rounds, timeout, stats):
+    """
+    1人分の操作を1ステップ (1回の再実行) ずつ進めるジェネレータ
+    再実行の時間は stats['rerun'] に、PDF作成の時間は stats['generation'] に追加する
+    """
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+    def rerun(action=None):
+        start = time.perf_counter()
+        (action or at).run()
+        stats['rerun'].append(time.perf_counter() - start)
+        if at.exception:
+            raise RuntimeError(f"セッション{n}: {at.exception[0].message}")
+
+    rerun()
+    yield at
+    for r in range(rounds):
+        # 行を追加する (1回ごとに再実行)
+        for list_key, button_key in (('business_reports', "add_business_report_button"), ('next_activities', "add_next_activity_button")):
+            while len(at.session_state[list_key]) < rows:
+                rerun(at.button(key=button_key).click())
+                yield at
+
+        # 全ての行と反省と課題を入力する (内容はセッション・回ごとに変えてキャッシュに当たらないようにする)
+        for prefix in ('br', 'na'):
+            for widget in at.text_input:
+                if widget.key and widget.key.startswith(f"{prefix}_date_"):
+                    widget.input(f"{r % 12 + 1}/{n % 28 + 1}")
+            for widget in at.text_area:
+                if widget.key and widget.key.startswith(f"{prefix}_content_"):
+                    widget.input(f"セッション{n} {r}回目 {widget.key} の報告内容です。運営委員会で確認しました。")
+        at.text_area(key="issues_text_area").input(f"セッション{n} {r}回目の反省と課題。" * 10)
+        rerun()
+        yield at
+
+        # 入力完了を押し、結果が表示されるまで待つ
+        start = time.perf_counter()
+        rerun(at.button(key="submit_button").click())
+        while not at.success:
+            if at.warning:
+                raise RuntimeError(f"セッション{n}: {at.warning[0].value}")
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError(f"セッション{n}: PDF作成が{timeout}秒以内に終わりませんでした")
+            yield at
+            # 作成待ちの表示の更新 (fragment の自動再実行) の代わりに画面全体を再実行する
+            at.run()
+        stats['generation'].append(time.perf_counter() - start)
+        yield at
+
+
+def run_load_test(sessions, rows, rounds, timeout):
+    stats = {'rerun': [], 'generation': []}
+    errors = []
+
+    # 起動直後の状態 (フォント・ワーカープールの準備済み) を基準のメモリとする
+    # 準備に使ったセッションの保持分は、セッションごとのメモリに含まれない
+    warmup = {'rerun': [], 'generation': []}
+    for _ in simulated_session(-1, 1, 1, timeout, warmup):
+        time.sleep(0.05)
+    rss_before = rss_bytes()
+
+    start = time.perf_counter()
+    active = {n: simulated_session(n, rows, rounds, timeout, stats) for n in range(sessions)}
+    apps = {} # 終了したセッションも画面の状態を保持しておき、メモリの計測に含める
+    while active:
+        for n, steps in list(active.items()):
+            try:
+                apps[n] = next(steps)
+            except StopIteration:
+                del active[n]
+            except Exception as e:
+                errors.append(str(e))
+                del active[n]
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    # 全員のセッション (入力内容・作成結果) を保持したままメモリを測る
+    rss_after = rss_bytes()
+    per_session = (rss_after - rss_before) / sessions if sessions else 0
+    result = {
+        'sessions': sessions,
+        'rows': rows,
+        'rounds': rounds,
+        'elapsed_s': elapsed,
+        'submissions_per_s': len(stats['generation']) / elapsed if elapsed else 0.0,
+        'rerun': summarize(stats['rerun']),
+        'generation': summarize(stats['generation']),
+        'memory': {
+            'rss_before_bytes': rss_before,
+            'rss_after_bytes': rss_after,
+            'rss_per_session_bytes': per_session,
+            'worker_rss_bytes': worker_rss_bytes(),
+        },
+        'errors': errors,
+    }
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="事業報告書アプリの同時利用の負荷試験")
+    parser.add_argument("-n", "--sessions", type=int, default=10, help="同時に開くセッション数")
+    parser.add_argument("--rows", type=int, default=5, help="事業内容報告・活動予定それぞれの行数")
+    parser.add_argument("--rounds", type=int, default=1, help="1セッションあたりの「入力完了」の回数")
+    parser.add_argument("--timeout", type=float, default=120, help="1回の再実行・PDF作成の待ち時間の上限 (秒)")
+    parser.add_argument("-o", "--out", help="結果を保存するJSONファイル")
+    args = parser.parse_args(argv)
+
+    # 試験で作成した報告書が本番の保存庫に登録されないようにする
+    os.environ.setdefault("REPORT_ARCHIVE_PATH", os.path.join(tempfile.mkdtemp(), "load_test.sqlite3"))
+
+    result = run_load_test(args.sessions, args.rows, args.rounds, args.timeout)
+    result['meta'] = {
+        'timestamp': datetime.now().isoformat(timespec="seconds"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'workers': os.environ.get("REPORT_PDF_WORKERS"),
+    }
+
+    ms = lambda s: f"{s * 1000:8.1f}ms" if s is not None else "       -"
+    mb = lambda b: f"{b / 1024 / 1024:.1f}MB"
+    for name, label in (('rerun', "再実行"), ('generation', "PDF作成")):
+        s = result[name]
+        print(f"{label:<6} {s['count']:>5}回  p50={ms(s['p50_s'])}  p95={ms(s['p95_s'])}  max={ms(s['max_s'])}")
+    memory = result['memory']
+    print(
+        f"メモリ: 開始時 {mb(memory['rss_before_bytes'])} → {args.sessions}セッション後 {mb(memory['rss_after_bytes'])} "
+        f"(1セッションあたり {mb(memory['rss_per_session_bytes'])}、ワーカー合計 {mb(memory['worker_rss_bytes'])})"
+    )
+    print(f"{result['elapsed_s']:.1f}秒 / {result['submissions_per_s']:.2f}件/秒")
+    for error in result['errors']:
+        print(f"失敗: {error}", file=sys.stderr)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.out}")
+    return 1 if result['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
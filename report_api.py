@@ -0,0 +1,222 @@
+"""
+事業報告書PDFの作成API (ローカル用のHTTPサーバー)
+
+名簿シートや広報誌作成ツールなどから、画面を使わずにPDFを作成するためのもの。
+報告データ (report_data) のJSONを「入力完了」と同じ規則で確認し、PDFを返す。
+作成はフォントを読み込み済みのワーカープロセス (report_pdf.GenerationPool) で行い、
+同時に作成する件数・作成待ちの件数には上限がある。HTTP/1.1 の keep-alive に対応する。
+
+使い方:
+    python report_api.py --port 8765
+
+    POST /reports        報告データ1件のJSON → PDF
+    POST /reports/batch  報告データのJSONのリスト → 各報告書のPDFをまとめたZIP
+    GET  /health         ワーカープールとPDFキャッシュの状態 (JSON)
+
+    curl -X POST --data-binary @report.json http://127.0.0.1:8765/reports -o report.pdf
+
+エラーは {"error": "..."} のJSONで返す (入力の誤りは 400、混雑時やワーカーの異常終了時は 503)。
+"""
+import argparse
+import io
+import json
+import logging
+import sys
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+
+from report_pdf import (
+    GenerationQueueFull, GenerationWorkerLost, emit_metrics, get_generation_pool, make_report_filename, pdf_cache,
+    report_data_from_json, validate_report_data,
+)
+
+# 受け付けるリクエスト本文の大きさの上限
+MAX_BODY_BYTES = 10 * 1024 * 1024
+# 1件のPDFの作成を待つ時間の上限 (秒)
+GENERATION_TIMEOUT = 120
+
+
+class RequestError(Exception):
+    """クライアントに返すエラー (HTTPステータスとメッセージ)"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def parse_report(record, prefix=""):
+    """
+    JSONの報告データを report_data に変換して確認する (誤りがあれば RequestError)
+    prefix はエラーメッセージの先頭に付ける (一括作成で何件目かを示す)
+    """
+    if not isinstance(record, dict):
+        raise RequestError(400, f"{prefix}報告データはJSONのオブジェクトで指定してください。")
+    try:
+        data = report_data_from_json(record)
+    except ValueError as e:
+        raise RequestError(400, f"{prefix}{e}") from e
+    error = validate_report_data(data)
+    if error:
+        raise RequestError(400, f"{prefix}{error}")
+    return data
+
+
+def submit(data):
+    """ワーカープールに作成を依頼する (混雑していれば 503)"""
+    try:
+        return get_generation_pool().submit(data)
+    except GenerationQueueFull as e:
+        raise RequestError(503, "ただいま混み合っています。少し待ってからもう一度送信してください。") from e
+    except GenerationWorkerLost as e:
+        raise RequestError(503, "PDFを作成できませんでした。少し待ってからもう一度送信してください。") from e
+
+
+def wait_for(job):
+    """作成したPDFのバイト列を返し、計測値を出力する"""
+    try:
+        pdf_bytes = job.result(timeout=GENERATION_TIMEOUT)
+    except TimeoutError as e:
+        raise RequestError(504, "PDFの作成が時間内に終わりませんでした。") from e
+    except GenerationWorkerLost as e:
+        # プールは作り直してあるので、もう一度送信すれば作成できる
+        raise RequestError(503, "PDFの作成が中断されました。もう一度送信してください。") from e
+    except Exception as e:
+        raise RequestError(500, f"PDFの作成に失敗しました: {e}") from e
+    emit_metrics(dict(job.metrics, source="api"))
+    return pdf_bytes
+
+
+def build_zip(entries):
+    """(ファイル名, PDF) のリストをZIPにまとめる (同じ名前は連番を付けて区別する)"""
+    buffer = io.BytesIO()
+    used = {}
+    # PDFは圧縮済みのため、ZIPでは圧縮せずに格納する
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as zf:
+        for file_name, pdf_bytes in entries:
+            count = used.get(file_name, 0) + 1
+            used[file_name] = count
+            if count > 1:
+                stem, ext = file_name.rsplit(".", 1)
+                file_name = f"{stem}_{count}.{ext}"
+            zf.writestr(file_name, pdf_bytes)
+    return buffer.getvalue()
+
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    # keep-alive のため HTTP/1.1 で応答する (応答には必ず Content-Length を付ける)
+    protocol_version = "HTTP/1.1"
+    # ヘッダーと本文を別々に送るため、Nagle アルゴリズムによる遅延 (約40ms) を避ける
+    disable_nagle_algorithm = True
+    server_version = "ReportPdfAPI/1.0"
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {'status': "ok", 'pool': get_generation_pool().stats(), 'cache': pdf_cache.stats()})
+        else:
+            self.send_json(404, {'error': "見つかりません。"})
+
+    def do_POST(self):
+        try:
+            body = self.read_json()
+            if self.path == "/reports":
+                self.handle_report(body)
+            elif self.path == "/reports/batch":
+                self.handle_batch(body)
+            else:
+                raise RequestError(404, "見つかりません。")
+        except RequestError as e:
+            self.send_json(e.status, {'error': e.message})
+
+    def handle_report(self, record):
+        data = parse_report(record)
+        pdf_bytes = wait_for(submit(data))
+        self.send_file(pdf_bytes, "application/pdf", make_report_filename(data['report_date'], data['department']))
+
+    def handle_batch(self, records):
+        if not isinstance(records, list) or not records:
+            raise RequestError(400, "報告データのリストを指定してください。")
+        pool = get_generation_pool()
+        if len(records) > pool.max_pending:
+            raise RequestError(413, f"一度に作成できるのは{pool.max_pending}件までです。")
+        # 全件を確認してから作成を依頼する (1件でも誤りがあれば作成しない)
+        reports = [parse_report(record, f"{n + 1}件目: ") for n, record in enumerate(records)]
+        jobs = [submit(data) for data in reports]
+        entries = [
+            (make_report_filename(data['report_date'], data['department']), wait_for(job))
+            for data, job in zip(reports, jobs)
+        ]
+        self.send_file(build_zip(entries), "application/zip", "事業報告書.zip")
+
+    def read_json(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length <= 0:
+            raise RequestError(411, "Content-Length を指定してください。")
+        if length > MAX_BODY_BYTES:
+            # 本文を読まずに応答するため、この接続は閉じる
+            self.close_connection = True
+            raise RequestError(413, "リクエストが大きすぎます。")
+        body = self.rfile.read(length)
+        try:
+            return json.loads(body)
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise RequestError(400, f"JSONとして読み込めません: {e}") from e
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 503:
+            self.send_header("Retry-After", "5")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_file(self, body, content_type, file_name):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        # 日本語のファイル名は RFC 5987 の形式で渡す
+        self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(file_name)}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.getLogger("report_api").info("%s %s", self.address_string(), format % args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="事業報告書PDFの作成APIを起動します")
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けるアドレス (既定はこのPCのみ)")
+    parser.add_argument("--port", type=int, default=8765, help="待ち受けるポート番号")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    # リクエストを受け付ける前にワーカーを起動し、フォントの読み込みを済ませておく
+    start = time.perf_counter()
+    try:
+        workers = get_generation_pool().warm_up()
+    except Exception as e:
+        print(f"ワーカーの起動に失敗しました: {e}", file=sys.stderr)
+        return 1
+    print(f"ワーカー{workers}個を起動しました ({time.perf_counter() - start:.1f}秒)", file=sys.stderr)
+
+    server = ThreadingHTTPServer((args.host, args.port), ReportRequestHandler)
+    server.daemon_threads = True
+    print(f"http://{args.host}:{args.port}/ で待ち受けています (Ctrl+C で終了)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+提出済み報告書の保存庫 (SQLite)
+
+入力内容 (report_data) と作成したPDFを保存し、部署・和暦の年月・本文の語句で
+検索して、作り直さずにすぐ再ダウンロードできるようにする。
+PDFは内容のハッシュ (SHA-256) ごとに1つだけ保存する。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from report_pdf import convert_to_wareki, report_key
+
+# 保存先のファイル
+ARCHIVE_PATH = os.environ.get("REPORT_ARCHIVE_PATH", "report_archive.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pdfs (
+    sha256 TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    report_key TEXT NOT NULL UNIQUE,
+    department TEXT NOT NULL,
+    report_date TEXT NOT NULL,
+    wareki_year TEXT NOT NULL,
+    month INTEGER NOT NULL,
+    data_json TEXT NOT NULL,
+    pdf_sha256 TEXT NOT NULL REFERENCES pdfs(sha256),
+    file_name TEXT NOT NULL,
+    submitted_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_department ON reports(department, report_date);
+CREATE INDEX IF NOT EXISTS reports_wareki ON reports(wareki_year, month);
+-- 日本語は単語の区切りがないため、3文字単位 (trigram) で全文検索する
+CREATE VIRTUAL TABLE IF NOT EXISTS reports_fts USING fts5(department, content, issues, tokenize='trigram');
+"""
+
+# trigram の全文検索が使える最短の語句の長さ (これより短い語句は LIKE で探す)
+_FTS_MIN_CHARS = 3
+
+
+def _report_text(data):
+    """全文検索用に、日程と内容の各行を1つの文字列にまとめる"""
+    rows = data['business_reports'] + data['next_activities']
+    return "\n".join(f"{item['date']} {item['content']}" for item in rows)
+
+
+def _to_json(data):
+    return json.dumps(
+        dict(
+            data,
+            report_date=data['report_date'].isoformat(),
+            business_reports=[{'date': item['date'], 'content': item['content']} for item in data['business_reports']],
+            next_activities=[{'date': item['date'], 'content': item['content']} for item in data['next_activities']],
+        ),
+        ensure_ascii=False,
+    )
+
+
+class ReportArchive:
+    """
+    報告書の保存庫
+    接続は操作ごとに開くので、Streamlit の複数セッション (スレッド) から共有して使える
+    """
+    def __init__(self, path=ARCHIVE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """接続を開き、終了時にコミットして閉じる"""
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def save(self, data, pdf_bytes, file_name):
+        """
+        報告データとPDFを保存し、報告書のIDを返す
+        同じ内容の報告書がすでにあれば、提出日時だけを更新する
+        """
+        sha256 = hashlib.sha256(pdf_bytes).hexdigest()
+        report_date = data['report_date']
+        wareki_year = convert_to_wareki(report_date).split('年')[0] # 例: "令和7"
+        submitted_at = datetime.now().isoformat(timespec="seconds")
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO pdfs (sha256, data, size) VALUES (?, ?, ?)",
+                (sha256, pdf_bytes, len(pdf_bytes)),
+            )
+            row = conn.execute(
+                "SELECT id, pdf_sha256 FROM reports WHERE report_key = ?", (report_key(data),)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE reports SET pdf_sha256 = ?, file_name = ?, submitted_at = ? WHERE id = ?",
+                    (sha256, file_name, submitted_at, row['id']),
+                )
+                # PDFが作り直されて変わった場合、どの報告書からも参照されなくなった古いPDFを削除する
+                if row['pdf_sha256'] != sha256:
+                    conn.execute(
+                        "DELETE FROM pdfs WHERE sha256 = ?"
+                        " AND NOT EXISTS (SELECT 1 FROM reports WHERE pdf_sha256 = ?)",
+                        (row['pdf_sha256'], row['pdf_sha256']),
+                    )
+                return row['id']
+            cur = conn.execute(
+                "INSERT INTO reports (report_key, department, report_date, wareki_year, month,"
+                " data_json, pdf_sha256, file_name, submitted_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    report_key(data), data['department'], report_date.isoformat(), wareki_year,
+                    report_date.month, _to_json(data), sha256, file_name, submitted_at,
+                ),
+            )
+            conn.execute(
+                "INSERT INTO reports_fts (rowid, department, content, issues) VALUES (?, ?, ?, ?)",
+                (cur.lastrowid, data['department'], _report_text(data), data['issues']),
+            )
+            return cur.lastrowid
+
+    def search(self, department=None, wareki_year=None, month=None, text=None, limit=50):
+        """
+        条件に合う報告書を新しい順に返す (PDF本体は含めない)
+        text は事業内容・活動予定・反省と課題の本文から探す
+        """
+        where = []
+        params = []
+        if department:
+            where.append("r.department = ?")
+            params.append(department)
+        if wareki_year:
+            where.append("r.wareki_year = ?")
+            params.append(wareki_year)
+        if month:
+            where.append("r.month = ?")
+            params.append(int(month))
+        if text:
+            if len(text) >= _FTS_MIN_CHARS:
+                where.append("r.id IN (SELECT rowid FROM reports_fts WHERE reports_fts MATCH ?)")
+                # LIKE で探す場合と同じく、部署名は対象にせず本文の列だけから探す
+                params.append('{content issues}: "' + text.replace('"', '""') + '"')
+            else:
+                # 語句に含まれる % と _ は、ワイルドカードではなく文字として探す
+                escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                where.append(
+                    "r.id IN (SELECT rowid FROM reports_fts"
+                    " WHERE content LIKE ? ESCAPE '\\' OR issues LIKE ? ESCAPE '\\')"
+                )
+                params.extend([f"%{escaped}%"] * 2)
+        sql = (
+            "SELECT r.id, r.department, r.report_date, r.wareki_year, r.month, r.file_name,"
+            " r.submitted_at, r.pdf_sha256, p.size AS pdf_size"
+            " FROM reports r JOIN pdfs p ON p.sha256 = r.pdf_sha256"
+        )
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY r.report_date DESC, r.id DESC LIMIT ?"
+        params.append(limit)
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+
+    def get_pdf(self, sha256):
+        """保存済みのPDFのバイト列を返す (無ければ None)"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM pdfs WHERE sha256 = ?", (sha256,)).fetchone()
+        return None if row is None else bytes(row['data'])
+
+    def get_report_data(self, report_id):
+        """保存済みの報告データ (report_data) を返す (無ければ None)"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT data_json FROM reports WHERE id = ?", (report_id,)).fetchone()
+        if row is None:
+            return None
+        data = json.loads(row['data_json'])
+        data['report_date'] = date.fromisoformat(data['report_date'])
+        return data
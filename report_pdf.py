@@ -0,0 +1,1099 @@
+"""
+事業報告書PDFの作成エンジン
+
+Streamlitに依存しないため、画面 (code01.py) 以外にも
+一括作成やテストなどから軽量に import して使える。
+fpdf2 は実際にPDFを作るときに初めて import する。
+"""
+import copy
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import multiprocessing.spawn
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime
+from functools import lru_cache
+from itertools import accumulate
+
+# 日本語フォントのパス (プロジェクトのルートにIPAexGothic.ttfがあることを想定)
+# Renderにデプロイする際、このファイルもGitリポジションに含める必要があります。
+FONT_PATH = "IPAexGothic.ttf"
+FONT_FAMILY = "IPAexGothic"
+
+# 担当部署
+DEPARTMENTS = [
+    "学年委員1年", "学年委員2年", "学年委員3年",
+    "学年委員4年", "学年委員5年", "学年委員6年",
+    "学年委員あゆみ", "広報部", "校外安全指導部",
+    "教養部", "環境厚生部", "選考委員会", "育成会本部"
+]
+
+# 改ページ処理で使うページ上下の余白と表の寸法 (mm)
+PAGE_TOP_MM = 20
+PAGE_BOTTOM_MARGIN_MM = 20
+TABLE_HEADER_HEIGHT = 10
+ROW_MIN_HEIGHT = 10
+ROW_PADDING = 2
+
+# バックグラウンド作成のワーカープロセス数と、作成待ちにできる件数の上限
+GENERATION_WORKERS = int(os.environ.get("REPORT_PDF_WORKERS", min(4, os.cpu_count() or 1)))
+GENERATION_MAX_PENDING = int(os.environ.get("REPORT_PDF_MAX_PENDING", 32))
+
+# 作成ごとの計測値を1行のJSONで追記するファイル (未設定ならログ出力のみ)
+METRICS_FILE = os.environ.get("REPORT_PDF_METRICS_FILE")
+
+# 計測値のログの出力レベル (既定は INFO で、標準エラー出力に出す。OFF なら出力しない)
+METRICS_LOG_LEVEL = os.environ.get("REPORT_PDF_METRICS_LOG", "INFO").upper()
+
+metrics_logger = logging.getLogger("report_pdf.metrics")
+# Streamlit などの既定のログ設定では INFO が出力されないため、専用の出力先を付ける
+# (ルートのロガーにも設定がある場合に二重に出力しないよう、親には伝えない)
+if not metrics_logger.handlers:
+    _metrics_handler = logging.StreamHandler()
+    _metrics_handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    metrics_logger.addHandler(_metrics_handler)
+    metrics_logger.propagate = False
+    if METRICS_LOG_LEVEL == "OFF":
+        metrics_logger.disabled = True
+    else:
+        # getLevelName はレベル名に対して数値を返す (不明な名前なら INFO にする)
+        _level = logging.getLevelName(METRICS_LOG_LEVEL)
+        metrics_logger.setLevel(_level if isinstance(_level, int) else logging.INFO)
+
+_metrics_file_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def load_shared_font():
+    """
+    IPAexGothicをプロセス内で1回だけ読み込み・解析し、全てのPDFで共有する
+    戻り値は (解析済みフォントのひな形, フォントファイルのバイト列)
+    """
+    from fpdf import FPDF
+
+    try:
+        with open(FONT_PATH, "rb") as f:
+            font_bytes = f.read()
+        # 解析はfpdf2に任せ、出来上がったフォントオブジェクトをひな形として保持する
+        loader = FPDF()
+        loader.add_font(FONT_FAMILY, fname=FONT_PATH)
+    except Exception as e:
+        raise RuntimeError(f"フォントの読み込みに失敗しました: {e}. '{FONT_PATH}' が存在するか確認してください。") from e
+    return loader.fonts[FONT_FAMILY.lower()], font_bytes
+
+def new_pdf():
+    """共有フォントを登録済みのFPDFを作成する"""
+    from fpdf import FPDF
+    from fpdf.fonts import SubsetMap
+    from fontTools import ttLib
+
+    pdf = FPDF()
+    template, font_bytes = load_shared_font()
+    # 文字幅・cmapなどの解析結果はひな形と共有し、
+    # 文書ごとに変わるサブセット情報だけを新しく用意する
+    # (出力時のサブセット化はttfontを書き換えるため、ttfontも文書ごとに開き直す)
+    font = copy.copy(template)
+    font.i = len(pdf.fonts) + 1
+    font.ttfont = ttLib.TTFont(io.BytesIO(font_bytes), recalcTimestamp=False, lazy=True)
+    font.missing_glyphs = []
+    font.biggest_size_pt = 0
+    font.subset = SubsetMap(font)
+    pdf.fonts[font.fontkey] = font
+    # デフォルトでこのフォントを使用するように設定
+    pdf.set_font(FONT_FAMILY, size=12) # デフォルトサイズを12に変更
+    return pdf
+
+@lru_cache(maxsize=None)
+def _measure_pdf():
+    """ページの寸法などを調べるためのPDF (出力はしない)"""
+    pdf = new_pdf()
+    pdf.add_page()
+    return pdf
+
+def convert_to_wareki(dt):
+    """日付を和暦文字列に変換する"""
+    if dt.year >= 2019:
+        era_name = "令和"
+        era_year = dt.year - 2018
+    elif dt.year >= 1989: # 平成の範囲
+        era_name = "平成"
+        era_year = dt.year - 1988
+    else: # その他の年 (昭和以前はここでは扱わない)
+        era_name = "西暦"
+        era_year = dt.year
+    return f"{era_name}{era_year}年{dt.month}月{dt.day}日"
+
+def make_report_filename(report_date, department):
+    """保存用のファイル名 (例: R7.06事業報告書_広報部.pdf) を作成する"""
+    wareki_year_str = convert_to_wareki(report_date).split('年')[0] # 例: "令和7"
+    wareki_prefix = ""
+    wareki_num = ""
+    # 漢字部分と数字部分を分離
+    for char in wareki_year_str:
+        if '0' <= char <= '9' or '一' <= char <= '九' or '〇' <= char <= '九' or '０' <= char <= '９': # 漢数字や全角数字も考慮
+            wareki_num += str(char)
+        else:
+            wareki_prefix += char
+
+    # 数字を半角に変換 (全角数字対策)
+    wareki_num = wareki_num.replace('〇', '0').replace('一', '1').replace('二', '2').replace('三', '3').replace('四', '4').replace('五', '5').replace('六', '6').replace('七', '7').replace('八', '8').replace('九', '9')
+    wareki_num = "".join(filter(str.isdigit, wareki_num)) # 半角数字以外を除去
+
+    # 「R」は令和の略なので、令和以外 (平成・西暦) や数字がない場合は西暦を使用
+    final_wareki_year_tag = f"R{wareki_num}" if wareki_prefix == "令和" and wareki_num else f"{report_date.year}"
+
+    file_month = report_date.month
+    return f"{final_wareki_year_tag}.{file_month:02d}事業報告書_{department}.pdf"
+
+# 行頭禁則: 行の先頭に来てはいけない文字 (句読点・閉じ括弧・小書きの仮名・長音など)
+NO_LINE_START = frozenset(
+    "、。，．,.・：；？！:;?!‼⁇⁈⁉ー―‐–〜～…‥"
+    ")）]］}｝〕〉》」』】〙〗〟’”｠»"
+    "ゝゞヽヾ々〻"
+    "ぁぃぅぇぉっゃゅょゎゕゖァィゥェォッャュョヮヵヶㇰㇱㇲㇳㇴㇵㇶㇷㇸㇹㇺㇻㇼㇽㇾㇿ"
+)
+# 行末禁則: 行の末尾に来てはいけない文字 (開き括弧)
+NO_LINE_END = frozenset("(（[［{｛〔〈《「『【〘〖〝‘“｟«")
+
+@lru_cache(maxsize=None)
+def _glyph_widths():
+    """
+    共有フォントの文字幅表を作る (プロセス内で1回だけ)
+    基本多言語面の全文字の幅 (1/1000em) を並べた配列と、フォントに無い文字の幅を返す
+    """
+    template, _ = load_shared_font()
+    missing = template.cw.default_factory() if template.cw.default_factory else 0
+    table = array('H', [missing]) * 0x10000
+    for code, width in template.cw.items():
+        if code < 0x10000:
+            table[code] = width
+    return table, missing
+
+def _is_word_char(c):
+    """英単語の一部として途中で折り返さない文字か"""
+    return c != ' ' and c < '\u2e80'
+
+def _break_position(text, start, end):
+    """
+    text[start:end] が幅に収まり text[end] がはみ出すとき、改行する位置を
+    (この行の末尾, 次の行の先頭) で返す
+    英単語の途中では折り返さずに空白で改行し (改行位置の空白1つだけを描画しない)、
+    禁則文字は前の文字と一緒に次の行へ送る (追い出し)
+    """
+    if text[end] == ' ':
+        return end, end + 1
+    brk = end
+    if _is_word_char(text[end]):
+        # 英単語の途中なら、直前の空白または日本語の文字の後ろまで戻る
+        for i in range(end - 1, start, -1):
+            if text[i] == ' ':
+                return i, i + 1
+            if not _is_word_char(text[i]):
+                brk = i + 1
+                break
+        else:
+            # 1行に収まらない長い単語は、収まる所で区切る
+            return end, end
+
+    def violates(i):
+        return (
+            text[i] in NO_LINE_START or text[i - 1] in NO_LINE_END
+            or (_is_word_char(text[i]) and _is_word_char(text[i - 1]))
+        )
+
+    # 次の行の先頭が行頭禁則文字、またはこの行の末尾が開き括弧なら、1文字ずつ戻す
+    pos = brk
+    while pos > start + 1 and violates(pos):
+        pos -= 1
+    if violates(pos):
+        # 行内に禁則を満たす改行位置が無い (句読点や長音が続くなど) ときは、元の位置で改行する
+        pos = brk
+    return pos, pos
+
+@lru_cache(maxsize=8192)
+def _wrap_paragraph(paragraph, max_width):
+    """
+    改行を含まない1段落を折り返した行のタプルを返す
+    max_width は1行の幅 (1/1000em 単位)
+    文字幅の累積和を一度に計算し、各行の末尾は二分探索で求める
+    """
+    table, missing = _glyph_widths()
+    try:
+        widths = map(table.__getitem__, map(ord, paragraph))
+        offsets = list(accumulate(widths, initial=0)) # offsets[i] = 先頭i文字の幅
+    except IndexError:
+        # 基本多言語面の外の文字 (絵文字など) はフォントに無い文字の幅で数える
+        widths = (table[ord(c)] if ord(c) < 0x10000 else missing for c in paragraph)
+        offsets = list(accumulate(widths, initial=0))
+
+    lines = []
+    start = 0
+    n = len(paragraph)
+    while start < n:
+        # この行に収まる最後の位置 (1文字も入らない幅でも1文字は置く)
+        end = max(bisect_right(offsets, offsets[start] + max_width, start + 1) - 1, start + 1)
+        if end >= n:
+            lines.append(paragraph[start:])
+            break
+        line_end, next_start = _break_position(paragraph, start, end)
+        lines.append(paragraph[start:line_end])
+        start = next_start
+    return tuple(lines) or ("",)
+
+@lru_cache(maxsize=4096)
+def wrap_text_lines(text, width, font_size):
+    """
+    テキストを幅widthで折り返した行のタプルを返す (計測のみで描画はしない)
+    文字幅表を使って段落ごとに折り返し、日本語の禁則処理も行う
+    (テキスト, 幅, フォントサイズ) ごと、段落ごとに結果をメモ化する
+    """
+    pdf = _measure_pdf()
+    # セルの左右の余白を除いた幅を、1/1000em 単位に換算する
+    max_width = (width - 2 * pdf.c_margin) * pdf.k * 1000 / font_size
+    lines = []
+    for paragraph in text.replace("\r\n", "\n").split("\n"):
+        lines.extend(_wrap_paragraph(paragraph, max_width))
+    return tuple(lines)
+
+def draw_text_lines(pdf, x, y, width, lines, line_height=5, align='L'):
+    """折り返し済みの行を上から順に1回だけ描画する"""
+    for n, line in enumerate(lines):
+        pdf.set_xy(x, y + line_height * n)
+        pdf.cell(w=width, h=line_height, txt=line, align=align)
+
+def page_bottom(pdf):
+    """本文を書ける下端のY座標"""
+    return pdf.h - PAGE_BOTTOM_MARGIN_MM
+
+def start_new_page(pdf):
+    """改ページして、新しいページの書き始めY座標を返す"""
+    pdf.add_page()
+    return PAGE_TOP_MM
+
+# --- レイアウトのテンプレート ---
+#
+# ページを上から順に並ぶ要素として宣言し、compile_template で座標・幅・見出しの
+# 折り返しなどを1回だけ計算しておく (PageLayout)。
+# 報告書ごとに行うのは、入力された文章の折り返し計測と描画だけになる。
+#
+# 寸法はmm。x は本文領域 (左右の margin_x の内側) の左端からの距離。
+# header の要素:
+#   text  : 1行の文字。text の代わりに field を指定すると報告データの値を表示する
+#           (format に FIELD_FORMATS の名前を指定すると変換してから表示する)
+#           y を省略すると直前の要素の下端から gap だけ空けて置く
+#           same_row=True なら直前の要素と同じ高さに置く
+#           span='page' ならページ幅いっぱい、anchor='right' なら本文領域の右端に揃える
+# body の要素 (直前の要素の下端から gap だけ空けて、内容に応じた高さで並べる):
+#   table : 見出し行付きの表。列のうち1つだけに wrap=True を指定し、その列を折り返して複数行にする
+#   box   : 見出し枠と、折り返した文章を入れる枠
+
+REPORT_TEMPLATE = {
+    'margin_x': 30, # ご要望の左右余白30mm
+    'font_size': 12,
+    'header': [
+        {'type': 'text', 'text': "***運営委員会にて提出をお願いします***", 'y': 15, 'h': 5, 'size': 10, 'span': 'page', 'align': 'C'},
+        {'type': 'text', 'text': "事業内容報告書", 'gap': 5, 'h': 10, 'size': 20, 'span': 'page', 'align': 'C'},
+        # 右上の日付 (「令和 年 月 日」形式)
+        {'type': 'text', 'field': 'report_date', 'format': 'wareki', 'gap': 5, 'w': 60, 'h': 5, 'anchor': 'right', 'align': 'R'},
+        # 「学年」「部」の下線 (添付ファイルの位置に合わせる)
+        {'type': 'text', 'text': "　", 'gap': 5, 'x': 10, 'w': 60, 'h': 8, 'border': 'B'},
+        {'type': 'text', 'text': "　", 'gap': 2, 'x': 10, 'w': 60, 'h': 8, 'border': 'B'},
+        # 担当部署名は「部」の下線の上、少し右に書く
+        {'type': 'text', 'field': 'department', 'same_row': True, 'x': 20, 'w': 50, 'h': 8},
+    ],
+    'body': [
+        {'type': 'table', 'field': 'business_reports', 'gap': 13, 'columns': [
+            {'title': "日程", 'key': 'date', 'ratio': 0.2},
+            {'title': "事業内容報告", 'key': 'content', 'ratio': 0.8, 'wrap': True},
+        ]},
+        {'type': 'box', 'field': 'issues', 'gap': 10,
+         'title': "活動の反省と課題\n(次年度以降の改善材料になりますので詳細にお願いします)",
+         'title_min_height': 16, 'title_padding': 5,
+         'title_offset': 0.5, # 見出し (2行) を従来どおり枠の上端から3.5mmの位置に置く
+         'padding': 9, 'min_lines': 5},
+        {'type': 'table', 'field': 'next_activities', 'gap': 10, 'columns': [
+            {'title': "日程", 'key': 'date', 'ratio': 0.2},
+            {'title': "次回運営委員会までの活動予定", 'key': 'content', 'ratio': 0.8, 'wrap': True},
+        ]},
+    ],
+}
+
+# 新しい種類の報告書は、テンプレートをここに追加すれば同じ仕組みで作成できる
+TEMPLATES = {
+    'report': REPORT_TEMPLATE,
+}
+
+# text 要素の format に指定できる変換
+FIELD_FORMATS = {
+    'wareki': convert_to_wareki,
+}
+
+class TextElement:
+    """位置の決まった1行の文字 (コンパイル済み)"""
+    def __init__(self, x, y, w, h, size, align, border, text, field, format):
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.size = size
+        self.align = align
+        self.border = border
+        self.text = text
+        self.field = field
+        self.format = format
+
+    def draw(self, pdf, data):
+        txt = self.text if self.field is None else self.format(data[self.field])
+        pdf.set_font(FONT_FAMILY, size=self.size)
+        pdf.set_xy(self.x, self.y)
+        pdf.cell(w=self.w, h=self.h, txt=txt, border=self.border, align=self.align)
+
+class TableElement:
+    """
+    見出し行付きの表 (コンパイル済み)
+    ページに収まらない行は次のページに送り、新しいページにも見出し行を繰り返す
+    1ページに収まらないほど長い内容は、ページをまたいで枠を分割する
+    行は1行ずつ順に処理するので、行数に比例した時間で描画できる
+    """
+    def __init__(self, field, gap, columns, wrap_key, text_x, text_w, font_size, value_h,
+                 header_height, row_min_height, padding, line_height, top, bottom):
+        self.field = field
+        self.gap = gap
+        self.columns = columns # (x, 幅, 見出し, 項目名) のタプル
+        self.wrap_key = wrap_key
+        self.text_x = text_x
+        self.text_w = text_w
+        self.font_size = font_size
+        self.value_h = value_h
+        self.header_height = header_height
+        self.row_min_height = row_min_height
+        self.padding = padding
+        self.line_height = line_height
+        self.top = top
+        self.bottom = bottom
+        # 改ページ直後の1ページに収まる行の高さの上限
+        self.fresh_page_room = bottom - top - header_height
+
+    def draw_header(self, pdf, y):
+        for x, w, title, _ in self.columns:
+            pdf.set_xy(x, y)
+            pdf.cell(w=w, h=self.header_height, txt=title, border=1, align='C')
+        return y + self.header_height
+
+    def draw(self, pdf, data, y):
+        """表を描画し、描画後のY座標を返す"""
+        line_h = self.line_height
+        pad = self.padding
+        # 見出し行と最低1行分が入らなければ、見出しごと次のページへ
+        if y + self.header_height + self.row_min_height > self.bottom:
+            y = start_new_page(pdf)
+        y = self.draw_header(pdf, y)
+
+        for item in data[self.field]:
+            lines = wrap_text_lines(item[self.wrap_key], self.text_w, self.font_size)
+            start = 0
+            while True:
+                remaining = len(lines) - start
+                # 枠の高さ = テキストの高さ + 上下パディング (最小高あり)
+                row_height = max(self.row_min_height, remaining * line_h + pad * 2)
+                room = self.bottom - y
+                if row_height <= room:
+                    n = remaining
+                elif row_height <= self.fresh_page_room or room < line_h + pad * 2:
+                    # 次のページなら収まる行 (または1行も入らない場合) は改ページしてから描画する
+                    y = self.draw_header(pdf, start_new_page(pdf))
+                    continue
+                else:
+                    # 1ページに収まらない行は、このページに入る分だけ描画する
+                    n = int((room - pad * 2) // line_h)
+                    row_height = room
+
+                for x, w, _, key in self.columns:
+                    pdf.rect(x, y, w, row_height)
+                    # 折り返さない列 (日程など) は垂直方向中央揃え、分割した場合は最初の枠にのみ記載
+                    if key != self.wrap_key and start == 0:
+                        pdf.set_xy(x, y + (row_height - self.value_h) / 2)
+                        pdf.cell(w=w, h=self.value_h, txt=item[key], align='C')
+
+                # 折り返す列 (上揃え)
+                draw_text_lines(pdf, self.text_x, y + pad, self.text_w, lines[start:start + n], line_h)
+
+                y += row_height # 枠の高さ分だけY座標を進める
+                start += n
+                if start >= len(lines):
+                    break
+                y = self.draw_header(pdf, start_new_page(pdf))
+        return y
+
+class BoxElement:
+    """
+    見出し枠と文章の枠 (コンパイル済み)
+    文章が長い場合はページをまたいで枠を分割する
+    """
+    def __init__(self, field, gap, x, width, font_size, title_lines, title_height, title_text_y,
+                 padding, min_height, line_height, top, bottom):
+        self.field = field
+        self.gap = gap
+        self.x = x
+        self.width = width
+        self.font_size = font_size
+        self.title_lines = title_lines
+        self.title_height = title_height
+        self.title_text_y = title_text_y # 見出し枠の上端から見出しの1行目までの距離
+        self.padding = padding
+        self.min_height = min_height
+        self.line_height = line_height
+        self.top = top
+        self.bottom = bottom
+
+    def draw(self, pdf, data, y):
+        """枠を描画し、描画後のY座標を返す"""
+        x = self.x
+        line_h = self.line_height
+        lines = wrap_text_lines(data[self.field], self.width - 2, self.font_size)
+
+        # 見出し枠と文章の1行目が同じページに収まらなければ改ページ
+        if y + self.title_height + line_h + self.padding > self.bottom:
+            y = start_new_page(pdf)
+        pdf.rect(x, y, self.width, self.title_height)
+        draw_text_lines(pdf, x + 1, y + self.title_text_y, self.width - 2, self.title_lines, line_h, align='C')
+        y += self.title_height
+
+        start = 0
+        while True:
+            remaining = len(lines) - start
+            fit = int((self.bottom - y - self.padding) // line_h)
+            if fit < 1:
+                y = start_new_page(pdf)
+                continue
+            n = min(remaining, fit)
+            # 最後の枠は最小の高さを確保する (ページ末尾を超えない範囲で)
+            box_height = n * line_h + self.padding
+            if n == remaining:
+                box_height = min(max(self.min_height, box_height), self.bottom - y)
+
+            pdf.rect(x, y, self.width, box_height)
+            draw_text_lines(pdf, x + 1, y + self.padding / 2, self.width - 2, lines[start:start + n], line_h)
+            y += box_height
+            start += n
+            if start >= len(lines):
+                break
+            y = start_new_page(pdf)
+        return y
+
+class PageLayout:
+    """コンパイル済みのテンプレート (全ての文書で使い回す)"""
+    def __init__(self, header, header_bottom, body, font_size):
+        self.header = header
+        self.header_bottom = header_bottom
+        self.body = body
+        self.font_size = font_size
+
+    def render(self, pdf, data, lap):
+        for element in self.header:
+            element.draw(pdf, data)
+        lap('header')
+
+        pdf.set_font(FONT_FAMILY, size=self.font_size)
+        y = self.header_bottom
+        for element in self.body:
+            y = element.draw(pdf, data, y + element.gap)
+            lap(element.field)
+
+    def count_rows(self, data):
+        """報告データのうち、表に描画する行の数 (計測値用)"""
+        return sum(len(data[element.field]) for element in self.body if isinstance(element, TableElement))
+
+def compile_template(template):
+    """テンプレートの座標・幅・見出しの折り返しを計算して PageLayout を作る"""
+    pdf = _measure_pdf()
+    page_w = pdf.w
+    bottom = page_bottom(pdf)
+    font_size = template['font_size']
+    line_height = 5
+    content_x = template['margin_x']
+    content_w = page_w - template['margin_x'] * 2
+
+    header = []
+    y = bottom_y = 0
+    for spec in template['header']:
+        if spec.get('same_row'):
+            pass
+        elif 'y' in spec:
+            y = spec['y']
+        else:
+            y = bottom_y + spec.get('gap', 0)
+        w = spec.get('w', content_w)
+        if spec.get('span') == 'page':
+            x, w = 0, page_w
+        elif spec.get('anchor') == 'right':
+            x = content_x + content_w - w
+        else:
+            x = content_x + spec.get('x', 0)
+        header.append(TextElement(
+            x, y, w, spec['h'], spec.get('size', font_size), spec.get('align', 'L'), spec.get('border', 0),
+            spec.get('text'), spec.get('field'), FIELD_FORMATS.get(spec.get('format'), str),
+        ))
+        bottom_y = y + spec['h']
+
+    body = []
+    for spec in template['body']:
+        if spec['type'] == 'table':
+            columns = []
+            wrap_key = None
+            text_x = text_w = None
+            x = content_x
+            for col in spec['columns']:
+                w = content_w * col['ratio']
+                columns.append((x, w, col['title'], col['key']))
+                if col.get('wrap'):
+                    # 左右に1mmずつ空けて書く
+                    wrap_key = col['key']
+                    text_x, text_w = x + 1, w - 2
+                x += w
+            if sum(1 for col in spec['columns'] if col.get('wrap')) != 1:
+                raise ValueError(f"表 {spec['field']} には折り返す列 (wrap=True) を1つだけ指定してください")
+            body.append(TableElement(
+                spec['field'], spec.get('gap', 0), tuple(columns), wrap_key, text_x, text_w, font_size,
+                font_size / pdf.k / pdf.k, # 日程などの1行の高さ (従来の枠内の中央揃えと同じ計算)
+                spec.get('header_height', TABLE_HEADER_HEIGHT), spec.get('row_min_height', ROW_MIN_HEIGHT),
+                spec.get('padding', ROW_PADDING), line_height, PAGE_TOP_MM, bottom,
+            ))
+        elif spec['type'] == 'box':
+            title_lines = wrap_text_lines(spec['title'], content_w - 2, font_size)
+            title_text_h = len(title_lines) * line_height
+            title_height = max(spec['title_min_height'], title_text_h + spec['title_padding'])
+            # 最小の高さは min_lines 行分の目安 (従来の計算と同じ)
+            min_height = spec['min_lines'] * (font_size / pdf.k * 1.2 / pdf.k) + spec['padding']
+            body.append(BoxElement(
+                spec['field'], spec.get('gap', 0), content_x, content_w, font_size, title_lines, title_height,
+                (title_height - title_text_h) / 2 + spec.get('title_offset', 0),
+                spec['padding'], min_height, line_height, PAGE_TOP_MM, bottom,
+            ))
+        else:
+            raise ValueError(f"不明なレイアウト要素です: {spec['type']}")
+
+    return PageLayout(tuple(header), bottom_y, tuple(body), font_size)
+
+@lru_cache(maxsize=None)
+def get_layout(name="report"):
+    """TEMPLATES のテンプレートをプロセス内で1回だけコンパイルして返す"""
+    return compile_template(TEMPLATES[name])
+
+def _init_worker():
+    # ワーカープロセスの起動時に、フォントの読み込みとレイアウトのコンパイルを済ませる
+    load_shared_font()
+    get_layout()
+
+def phase_timer(metrics):
+    """
+    処理の区切りごとに呼ぶ計測関数を返す
+    lap("名前") を呼ぶと、前回の呼び出しからの経過秒数を metrics['phases'] に加算する
+    metrics が None の場合は何も記録しない
+    """
+    last = [time.perf_counter()]
+
+    def lap(name):
+        now = time.perf_counter()
+        if metrics is not None:
+            phases = metrics.setdefault('phases', {})
+            phases[name] = phases.get(name, 0.0) + now - last[0]
+        last[0] = now
+
+    return lap
+
+def emit_metrics(metrics):
+    """計測値を構造化ログ (JSON) として出力し、設定があればファイルにも追記する"""
+    record = dict(metrics, timestamp=datetime.now().isoformat(timespec="milliseconds"))
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    metrics_logger.info(line)
+    if METRICS_FILE:
+        with _metrics_file_lock, open(METRICS_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+def render_report(pdf, data, lap=None, layout="report"):
+    """
+    報告書1件分を、追加済みの新しいページから描画する
+    仕様書PDFのレイアウトを再現 (レイアウトは TEMPLATES の layout を使う)
+    lap には phase_timer の計測関数を渡せる
+    """
+    if lap is None:
+        lap = phase_timer(None)
+    get_layout(layout).render(pdf, data, lap)
+
+def create_report_pdf(data, metrics=None, layout="report"):
+    """
+    入力データに基づいて事業報告書PDFを作成する (fpdf2バージョン)
+    layout には TEMPLATES のテンプレート名を指定する
+    フォントが読み込めない場合は RuntimeError を送出する
+    metrics に辞書を渡すと、処理ごとの時間・ページ数・行数・出力サイズを記録する
+    """
+    lap = phase_timer(metrics)
+    pdf = new_pdf()
+    # 作成日時を報告書作成日にして、同じ内容なら同じバイト列のPDFになるようにする
+    # (キャッシュや保存庫で、内容のハッシュごとに1つだけ保存できる)
+    pdf.set_creation_date(datetime.combine(data['report_date'], datetime.min.time()))
+    lap('font_setup')
+    # 改ページは表の見出し行の繰り返しなどのため自前で行う
+    pdf.set_auto_page_break(False)
+    pdf.add_page()
+    render_report(pdf, data, lap, layout)
+    
+    # PDFをバイトストリームとして出力
+    pdf_buffer = io.BytesIO(pdf.output())
+    lap('output')
+    if metrics is not None:
+        metrics['pages'] = pdf.pages_count
+        metrics['rows'] = get_layout(layout).count_rows(data)
+        metrics['output_bytes'] = pdf_buffer.getbuffer().nbytes
+    return pdf_buffer
+
+
+
+# 目次の1行の高さと、1ページ目の書き始めY座標 (mm)
+TOC_LINE_HEIGHT = 7
+TOC_TOP_MM = 40
+
+def _toc_entries_per_page(pdf):
+    return int((page_bottom(pdf) - TOC_TOP_MM) // TOC_LINE_HEIGHT)
+
+def _render_toc(pdf, outline):
+    """目次を描画する (部署を見出し、各報告書を字下げした行として並べる)"""
+    per_page = _toc_entries_per_page(pdf)
+    for n, section in enumerate(outline):
+        if n % per_page == 0:
+            if n > 0:
+                # 目次用のページは確保済みなので、次のページに移るだけでよい
+                pdf.page += 1
+            pdf.set_font(FONT_FAMILY, size=20)
+            pdf.set_xy(0, 20)
+            pdf.cell(w=pdf.w, h=10, txt="目次", align='C')
+            pdf.set_font(FONT_FAMILY, size=12)
+        y = TOC_TOP_MM + (n % per_page) * TOC_LINE_HEIGHT
+        x = 30 + 8 * section.level
+        link = pdf.add_link(page=section.page_number)
+        pdf.set_xy(x, y)
+        pdf.cell(w=pdf.w - 30 - x - 15, h=TOC_LINE_HEIGHT, txt=section.name, link=link)
+        pdf.cell(w=15, h=TOC_LINE_HEIGHT, txt=str(section.page_number), align='R', link=link)
+
+def create_booklet_pdf(records, metrics=None):
+    """
+    複数の報告データを、目次付きの1冊のPDF (運営委員会配布用) にまとめる
+    部署ごとに1つの章とし、部署の並びは DEPARTMENTS の順、同じ部署の中は日付順にする
+    フォントは1回だけ (全報告書で使う文字をまとめたサブセットとして) 埋め込まれる
+    """
+    lap = phase_timer(metrics)
+    order = {name: n for n, name in enumerate(DEPARTMENTS)}
+    records = sorted(records, key=lambda r: (order.get(r['department'], len(order)), r['department'], r['report_date']))
+
+    pdf = new_pdf()
+    pdf.set_auto_page_break(False)
+    pdf.set_compression(True)
+    lap('font_setup')
+
+    # 目次の行数 = 部署の数 + 報告書の数
+    toc_entries = len({r['department'] for r in records}) + len(records)
+    toc_pages = max(1, -(-toc_entries // _toc_entries_per_page(pdf)))
+    pdf.add_page()
+    pdf.insert_toc_placeholder(_render_toc, pages=toc_pages)
+
+    # 目次の確保で次のページに移っているので、最初の報告書はそのページから描画する
+    current_department = None
+    for n, data in enumerate(records):
+        if n > 0:
+            pdf.add_page()
+        if data['department'] != current_department:
+            current_department = data['department']
+            pdf.start_section(current_department, level=0)
+        pdf.start_section(convert_to_wareki(data['report_date']), level=1)
+        render_report(pdf, data, lap)
+
+    pdf_buffer = io.BytesIO(pdf.output())
+    lap('output')
+    if metrics is not None:
+        metrics['reports'] = len(records)
+        metrics['pages'] = pdf.pages_count
+        metrics['output_bytes'] = pdf_buffer.getbuffer().nbytes
+    return pdf_buffer
+
+def report_key(data):
+    """
+    報告データを正規化してハッシュ化したキーを返す
+    PDFの内容に関係する項目 (日付・部署・各行・反省と課題) だけを使う
+    """
+    normalized = {
+        'report_date': data['report_date'].isoformat(),
+        'department': data['department'],
+        'business_reports': [[item['date'], item['content']] for item in data['business_reports']],
+        'issues': data['issues'],
+        'next_activities': [[item['date'], item['content']] for item in data['next_activities']],
+    }
+    payload = json.dumps(normalized, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _row_is_incomplete(item):
+    """日程と内容の片方だけが入力された行か (両方空の行は無視する)"""
+    return bool(item['date'] or item['content']) and not (item['date'].strip() and item['content'].strip())
+
+def validate_report_data(data):
+    """
+    報告データを「入力完了」と同じ規則で確認する
+    問題があれば利用者向けのメッセージを、問題が無ければ None を返す
+    """
+    if not data['department']:
+        return "担当部署を選択してください。"
+    if data['department'] not in DEPARTMENTS:
+        return f"担当部署「{data['department']}」は登録されていません。"
+    if any(_row_is_incomplete(item) for item in data['business_reports']):
+        return "事業内容報告の日程と内容をすべて入力するか、不要な行を削除してください。"
+    if not data['issues'].strip():
+        return "活動の反省と課題を入力してください。"
+    if any(_row_is_incomplete(item) for item in data['next_activities']):
+        return "次回活動予定の日程と内容をすべて入力するか、不要な行を削除してください。"
+    return None
+
+def _json_text(value, name):
+    """JSONの値を文字列にする (null は空、数値は文字列として扱い、それ以外は ValueError)"""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ValueError(f"{name} は文字列で指定してください: {value!r}")
+
+def _json_rows(rows, name):
+    """JSONの日程と内容の行のリストを変換する (null は行なしとして扱う)"""
+    if rows is None:
+        return []
+    if not isinstance(rows, list):
+        raise ValueError(f"{name} はリストで指定してください")
+    return [
+        {'date': _json_text(item.get('date'), f"{name}.date"), 'content': _json_text(item.get('content'), f"{name}.content")}
+        for item in rows
+    ]
+
+def report_data_from_json(record):
+    """
+    JSONから読み込んだ報告データを report_data の形にする
+    report_date は "2025-06-01" 形式の文字列、省略した項目や null は空として扱う
+    形式が正しくない場合は ValueError を送出する
+    """
+    try:
+        return {
+            'report_date': date.fromisoformat(record['report_date']),
+            'department': _json_text(record.get('department'), 'department'),
+            'business_reports': _json_rows(record.get('business_reports'), 'business_reports'),
+            'issues': _json_text(record.get('issues'), 'issues'),
+            'next_activities': _json_rows(record.get('next_activities'), 'next_activities'),
+        }
+    except (KeyError, TypeError, AttributeError, ValueError) as e:
+        raise ValueError(f"報告データの形式が正しくありません: {e!r}") from e
+
+class ReportPdfCache:
+    """
+    作成済みPDFのキャッシュ (報告データのハッシュ → PDFのバイト列)
+    合計バイト数の上限を超えたら、最も長く使われていないものから削除する
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            pdf_bytes = self._entries.get(key)
+            if pdf_bytes is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return pdf_bytes
+
+    def put(self, key, pdf_bytes):
+        if len(pdf_bytes) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= len(old)
+            self._entries[key] = pdf_bytes
+            self._total_bytes += len(pdf_bytes)
+            while self._total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        """ヒット数・ミス数・件数・合計バイト数を返す"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+            }
+
+# 同じサーバープロセス内の全セッションで共有する
+pdf_cache = ReportPdfCache(max_bytes=64 * 1024 * 1024)
+
+def lookup_cached_pdf(data, metrics):
+    """
+    同じ内容の報告データの作成済みPDFをキャッシュから探す
+    (キャッシュのキー, PDFのバイト列または None) を返し、キャッシュの当否を metrics に記録する
+    """
+    key = report_key(data)
+    pdf_bytes = pdf_cache.get(key)
+    metrics['department'] = data['department']
+    metrics['cache_hit'] = pdf_bytes is not None
+    if pdf_bytes is not None:
+        metrics['output_bytes'] = len(pdf_bytes)
+    return key, pdf_bytes
+
+class GenerationQueueFull(RuntimeError):
+    """作成待ちの件数が上限に達していて、新しい作成を受け付けられない"""
+
+class GenerationWorkerLost(RuntimeError):
+    """ワーカープロセスが異常終了して作成できなかった (プールは作り直すので、もう一度依頼できる)"""
+
+def _generate_in_worker(data, submitted_at):
+    """ワーカープロセス側でPDFを作成する (待ち時間も計測値に含める)"""
+    metrics = {'phases': {'queue_wait': max(0.0, time.time() - submitted_at)}}
+    pdf_bytes = create_report_pdf(data, metrics).getvalue()
+    return pdf_bytes, metrics
+
+class ReportJob:
+    """バックグラウンドで作成中のPDF 1件分"""
+    def __init__(self, future, submitted_at, metrics, worker_future=None):
+        self._future = future
+        self._worker_future = worker_future
+        self.submitted_at = submitted_at
+        self.metrics = metrics
+
+    def done(self):
+        return self._future.done()
+
+    def state(self):
+        """「待機中」「作成中」「完了」のいずれかを返す"""
+        if self._future.done():
+            return "完了"
+        if self._worker_future is not None and self._worker_future.running():
+            return "作成中"
+        return "待機中"
+
+    def elapsed(self):
+        return time.time() - self.submitted_at
+
+    def result(self, timeout=None):
+        """作成したPDFのバイト列を返す (作成に失敗した場合はその例外を送出する)"""
+        return self._future.result(timeout)
+
+# ワーカーの起動時に __main__ の準備情報を一時的に差し替えるため、起動を1つずつ行う
+_worker_spawn_lock = threading.Lock()
+
+class _WorkerProcess(multiprocessing.context.SpawnProcess):
+    """
+    親プロセスの __main__ を読み込み直さない spawn のワーカープロセス
+    spawn は通常、子プロセスで親の __main__ を実行し直す。streamlit run では
+    それが streamlit の起動スクリプト (streamlit 全体を import する) や、
+    Streamlit が __main__ として差し替えた画面のスクリプト (code01.py) になってしまう。
+    ワーカーで実行するのは report_pdf の関数だけなので、__main__ の情報を渡さずに起動する
+    """
+    @staticmethod
+    def _Popen(process_obj):
+        get_preparation_data = multiprocessing.spawn.get_preparation_data
+
+        def without_main(name):
+            data = get_preparation_data(name)
+            data.pop('init_main_from_name', None)
+            data.pop('init_main_from_path', None)
+            return data
+
+        with _worker_spawn_lock:
+            multiprocessing.spawn.get_preparation_data = without_main
+            try:
+                return multiprocessing.context.SpawnProcess._Popen(process_obj)
+            finally:
+                multiprocessing.spawn.get_preparation_data = get_preparation_data
+
+class _WorkerContext(multiprocessing.context.SpawnContext):
+    """_WorkerProcess でワーカーを起動する spawn のコンテキスト"""
+    Process = _WorkerProcess
+
+class GenerationPool:
+    """
+    PDF作成用のワーカープロセスのプール
+    同時に作成する件数は max_workers、作成待ちにできる件数は max_pending までに制限する
+    ワーカーは起動時にフォントの読み込みとレイアウトのコンパイルを1回だけ行う
+    ワーカーが異常終了 (メモリ不足・強制終了など) したら、プールを作り直して受付を続ける
+    """
+    def __init__(self, max_workers, max_pending):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+        self._pending = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+
+    def _new_executor(self):
+        # サーバーのスレッドを複製しないよう spawn で起動する
+        # (__main__ は読み込み直さず、report_pdf とその依存だけを import する)
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=_WorkerContext(),
+            initializer=_init_worker,
+        )
+
+    def _restart_executor(self, broken):
+        """
+        ワーカーが異常終了して使えなくなったプールを作り直す
+        (同時に複数の依頼が失敗しても、作り直すのは1回だけにする)
+        """
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = self._new_executor()
+            self.restarts += 1
+        broken.shutdown(wait=False)
+
+    def _submit_to_executor(self, *args):
+        """
+        プールに作業を渡し、(渡したプール, Future) を返す
+        プールが壊れていれば作り直して1回だけやり直す
+        """
+        for retry in (False, True):
+            executor = self._executor
+            try:
+                return executor, executor.submit(*args)
+            except BrokenProcessPool as e:
+                self._restart_executor(executor)
+                if retry:
+                    raise GenerationWorkerLost("ワーカープロセスを起動できません") from e
+
+    def submit(self, data):
+        """
+        PDFの作成を依頼して ReportJob を返す
+        キャッシュに同じ内容のPDFがあれば、作成せずに完了済みのジョブを返す
+        作成待ちが上限に達している場合は GenerationQueueFull を送出する
+        作成中にワーカーが異常終了した場合、ジョブの結果は GenerationWorkerLost になる
+        """
+        submitted_at = time.time()
+        metrics = {}
+        key, pdf_bytes = lookup_cached_pdf(data, metrics)
+        if pdf_bytes is not None:
+            future = Future()
+            future.set_result(pdf_bytes)
+            return ReportJob(future, submitted_at, metrics)
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise GenerationQueueFull("作成待ちの件数が上限に達しています")
+            self._pending += 1
+            self.submitted += 1
+        try:
+            executor, worker_future = self._submit_to_executor(_generate_in_worker, data, submitted_at)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+        future = Future()
+
+        def on_done(f):
+            try:
+                pdf_bytes, worker_metrics = f.result()
+            except Exception as e:
+                with self._lock:
+                    self._pending -= 1
+                    self.failed += 1
+                if isinstance(e, BrokenProcessPool):
+                    # 壊れたプールは以降の依頼も全て失敗するため、ここで作り直しておく
+                    self._restart_executor(executor)
+                    e = GenerationWorkerLost("PDFの作成中にワーカープロセスが終了しました")
+                future.set_exception(e)
+                return
+            metrics.update(worker_metrics)
+            queue_wait = worker_metrics['phases']['queue_wait']
+            with self._lock:
+                self._pending -= 1
+                self.completed += 1
+                self._queue_wait_total += queue_wait
+                self._queue_wait_max = max(self._queue_wait_max, queue_wait)
+            pdf_cache.put(key, pdf_bytes)
+            future.set_result(pdf_bytes)
+
+        worker_future.add_done_callback(on_done)
+        return ReportJob(future, submitted_at, metrics, worker_future)
+
+    def warm_up(self):
+        """
+        全てのワーカープロセスを今すぐ起動し、フォントの読み込みとレイアウトのコンパイルを済ませる
+        (何もしなければ、最初の作成依頼のときに起動する)
+        """
+        futures = [self._submit_to_executor(os.getpid)[1] for _ in range(self.max_workers)]
+        return len({f.result() for f in futures})
+
+    def stats(self):
+        """作成待ち件数・処理件数・待ち時間 (平均と最大) を返す"""
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'pending': self._pending,
+                'max_pending': self.max_pending,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'completed': self.completed,
+                'failed': self.failed,
+                'restarts': self.restarts,
+                'queue_wait_avg_s': self._queue_wait_total / self.completed if self.completed else 0.0,
+                'queue_wait_max_s': self._queue_wait_max,
+            }
+
+@lru_cache(maxsize=None)
+def get_generation_pool():
+    """プロセス内で共有する GenerationPool (最初に使うときに起動する)"""
+    return GenerationPool(GENERATION_WORKERS, GENERATION_MAX_PENDING)
+
+@lru_cache(maxsize=32)
+def render_page_thumbnails(pdf_bytes, width_px=700):
+    """
+    PDFの各ページを幅width_pxのPNG画像に変換し、ページ順のタプルで返す (プレビュー用)
+    pypdfium2 が入っていない場合は ImportError を送出する
+    """
+    import pypdfium2 as pdfium
+
+    thumbnails = []
+    doc = pdfium.PdfDocument(pdf_bytes)
+    try:
+        for page in doc:
+            # PDFの1ポイント = scale 1.0 で1ピクセル
+            # 報告書は白黒なのでグレースケールにしてPNGを小さくする
+            image = page.render(scale=width_px / page.get_width(), grayscale=True).to_pil().convert("L")
+            buf = io.BytesIO()
+            image.save(buf, format="PNG", optimize=True)
+            thumbnails.append(buf.getvalue())
+    finally:
+        doc.close()
+    return tuple(thumbnails)
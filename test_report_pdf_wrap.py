@@ -0,0 +1,93 @@
+"""
+report_pdf の折り返し (wrap_text_lines / _wrap_paragraph) のテスト
+
+英数字だけの文章は fpdf の multi_cell と同じ行になること、
+日本語は禁則処理 (追い出し・行内に改行位置が無い場合の扱い) が正しいことを確かめる。
+フォント (IPAexGothic.ttf) が無い環境ではスキップする。
+
+使い方:
+    python -m unittest test_report_pdf_wrap
+"""
+import os
+import random
+import unittest
+
+import report_pdf
+from report_pdf import _glyph_widths, _wrap_paragraph, wrap_text_lines
+
+ASCII_WORDS = ("PTA", "meeting", "report", "2025", "school", "event", "plan", "check", "OK", "No.")
+
+
+def text_width(text):
+    """文字幅表で数えた text の幅 (1/1000em 単位)"""
+    table, missing = _glyph_widths()
+    return sum(table[ord(c)] if ord(c) < 0x10000 else missing for c in text)
+
+
+def wrap(paragraph, fit):
+    """先頭から fit までの文字がちょうど1行に収まる幅で折り返す"""
+    return _wrap_paragraph(paragraph, text_width(fit))
+
+
+@unittest.skipUnless(os.path.exists(report_pdf.FONT_PATH), f"{report_pdf.FONT_PATH} がありません")
+class WrapTextTest(unittest.TestCase):
+    def test_ascii_matches_multi_cell(self):
+        # 英数字は禁則処理の対象外なので、multi_cell と同じ位置で改行する (前後の空白を含む)
+        rng = random.Random(0)
+        pdf = report_pdf.new_pdf()
+        pdf.add_page()
+        for _ in range(300):
+            text = " ".join(rng.choice(ASCII_WORDS) for _ in range(rng.randint(1, 40)))
+            if rng.random() < 0.3:
+                text += " " * rng.randint(1, 30)
+            if rng.random() < 0.2:
+                text = " " * rng.randint(1, 5) + text
+            width = rng.choice((20, 30, 60, 118, 148))
+            expected = tuple(pdf.multi_cell(w=width, h=5, txt=text, align='L', dry_run=True, output="LINES"))
+            self.assertEqual(wrap_text_lines(text, width, pdf.font_size_pt), expected, (text, width))
+
+    def test_no_line_start_is_pushed_with_previous_char(self):
+        # 句点が行頭に来る場合は、直前の文字と一緒に次の行へ送る (追い出し)
+        self.assertEqual(wrap("あいうえ。かき", "あいうえ"), ("あいう", "え。かき"))
+
+    def test_no_line_end_moves_to_next_line(self):
+        # 開き括弧は行末に残さず、次の行の先頭に送る
+        self.assertEqual(wrap("あいう「えお」", "あいう「"), ("あいう", "「えお」"))
+
+    def test_run_of_no_line_start_falls_back_to_original_break(self):
+        # 句点が続いて行内に禁則を満たす改行位置が無いときは、1文字ずつの行にせず元の位置で改行する
+        paragraph = "あ" + "。" * 20
+        lines = wrap(paragraph, "あ。。。。")
+        self.assertEqual("".join(lines), paragraph)
+        self.assertEqual([len(line) for line in lines], [5, 5, 5, 5, 1])
+
+    def test_latin_word_is_not_split(self):
+        # 英単語の途中では折り返さず、改行位置の空白1つだけを描画しない
+        self.assertEqual(wrap("hello world", "hello wo"), ("hello", "world"))
+        self.assertEqual(wrap("日本語 meeting", "日本語 mee"), ("日本語", "meeting"))
+
+    def test_long_latin_word_is_hard_broken(self):
+        # 1行に収まらない長い単語は、収まる所で区切る (文字は失わない)
+        paragraph = "a" * 50
+        lines = wrap(paragraph, "a" * 12)
+        self.assertEqual("".join(lines), paragraph)
+        self.assertTrue(all(len(line) == 12 for line in lines[:-1]))
+
+    def test_non_bmp_characters(self):
+        # 基本多言語面の外の文字 (絵文字など) も、フォントに無い文字の幅で数えて折り返す
+        paragraph = "報告\U0001F600\U0001F600です" * 5
+        lines = wrap(paragraph, "報告\U0001F600\U0001F600")
+        self.assertEqual("".join(lines), paragraph)
+        self.assertGreater(len(lines), 1)
+
+    def test_last_char_overflow(self):
+        # 最後の1文字だけがはみ出す場合も、その1文字を次の行に置く
+        self.assertEqual(wrap("あいうえお", "あいうえ"), ("あいうえ", "お"))
+
+    def test_paragraphs_and_empty_text(self):
+        self.assertEqual(wrap_text_lines("", 50, 12), ("",))
+        self.assertEqual(wrap_text_lines("あ\r\n\nい", 50, 12), ("あ", "", "い"))
+
+
+if __name__ == "__main__":
+    unittest.main()